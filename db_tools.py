@@ -0,0 +1,228 @@
+import os
+import time
+import argparse
+import numpy as np
+from src.metadata_store import convert_tinydb_to_sqlite, TINYDB_FILE, SQLITE_FILE
+
+def convert_metadata(args):
+    json_path = os.path.join(args.db_path, TINYDB_FILE)
+    sqlite_path = os.path.join(args.db_path, SQLITE_FILE)
+    num = convert_tinydb_to_sqlite(json_path, sqlite_path)
+    print(f'Converted {num} papers from {json_path} to {sqlite_path}')
+
+def build_ann(args):
+    import faiss
+    from src.ann_index import ANN_DIR, VARIANTS, flat_index_path, load_manifest, save_manifest, default_nlist, build_variant, evaluate_recall
+
+    os.makedirs(os.path.join(args.db_path, ANN_DIR), exist_ok=True)
+    manifest = load_manifest(args.db_path)
+    variants = args.variants.split(',')
+    fields = args.fields.split(',')
+    nprobes = [int(_) for _ in args.nprobe.split(',')]
+    ef_searches = [int(_) for _ in args.ef_search.split(',')]
+
+    for field in fields:
+        flat = faiss.read_index(flat_index_path(args.db_path, field))
+        vectors = flat.reconstruct_n(0, flat.ntotal)
+        nlist = args.nlist or default_nlist(flat.ntotal)
+        rng = np.random.default_rng(args.seed)
+        queries = vectors[rng.choice(len(vectors), min(args.eval_queries, len(vectors)), replace=False)]
+
+        for variant in variants:
+            factory = VARIANTS[variant].format(nlist=nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+            print(f'Building {variant} ({factory}) for {field} over {flat.ntotal} vectors')
+            start = time.time()
+            index = build_variant(vectors, factory, flat.metric_type, train_size=args.train_size, seed=args.seed)
+            build_seconds = time.time() - start
+
+            rel_path = os.path.join(ANN_DIR, f'faiss_paper_{field}_embeddings.{variant}.bin')
+            faiss.write_index(index, os.path.join(args.db_path, rel_path))
+
+            if faiss.try_extract_index_ivf(index) is not None:
+                evals = [evaluate_recall(flat, index, queries, k=args.k, nprobe=n) for n in nprobes]
+            elif 'HNSW' in factory:
+                evals = [evaluate_recall(flat, index, queries, k=args.k, ef_search=ef) for ef in ef_searches]
+            else:
+                evals = [evaluate_recall(flat, index, queries, k=args.k)]
+            for e in evals:
+                print(f"  nprobe={e['nprobe']} efSearch={e['ef_search']} recall@{e['k']}={e['recall']:.4f} "
+                      f"{e['ms_per_query']:.3f} ms/query (flat {e['flat_ms_per_query']:.3f} ms/query)")
+
+            entry = manifest['variants'].setdefault(variant, {'factory': factory, 'files': {}, 'build': {}, 'eval': {}})
+            entry['factory'] = factory
+            entry['files'][field] = rel_path
+            entry['build'][field] = {'ntotal': index.ntotal, 'seconds': build_seconds}
+            entry['eval'][field] = evals
+            save_manifest(args.db_path, manifest)
+
+def bench_embedding(args):
+    from src.embedding import load_embedding_model, benchmark_encoder, cosine_similarity_rows, BENCHMARK_QUERIES
+    from src.ann_index import flat_index_path
+
+    if args.queries:
+        with open(args.queries, 'r') as f:
+            queries = [l.strip() for l in f if l.strip()]
+    else:
+        queries = BENCHMARK_QUERIES
+    queries = ['search_query: ' + _ for _ in queries]
+
+    reference = load_embedding_model(args.embedding_model, device=args.device, num_threads=args.num_threads)
+    ref_embeddings, ref_qps = benchmark_encoder(reference, queries, args.batch_size, args.repeat)
+    del reference
+    candidate = load_embedding_model(args.embedding_model, device=args.device, quantize=args.quantize, num_threads=args.num_threads)
+    embeddings, qps = benchmark_encoder(candidate, queries, args.batch_size, args.repeat)
+
+    cos = cosine_similarity_rows(ref_embeddings, embeddings)
+    print(f'{len(queries)} queries, device={args.device}, threads={args.num_threads or "default"}')
+    print(f'fp32: {ref_qps:.1f} queries/sec')
+    print(f'{args.quantize or "fp32"}: {qps:.1f} queries/sec ({qps / ref_qps:.2f}x)')
+    print(f'cosine to fp32: mean={cos.mean():.5f} min={cos.min():.5f}')
+
+    index_path = flat_index_path(args.db_path, 'abs')
+    if os.path.exists(index_path):
+        import faiss
+        index = faiss.read_index(index_path)
+        _, ref_ids = index.search(ref_embeddings, args.k)
+        _, ids = index.search(embeddings, args.k)
+        overlap = np.mean([len(set(r) & set(c)) / args.k for r, c in zip(ref_ids, ids)])
+        print(f'recall@{args.k} against fp32 retrieval: {overlap:.4f}')
+
+def ingest(args):
+    from src.ingest import load_papers, ingest_papers
+    papers = load_papers(args.papers)
+    num = ingest_papers(args.db_path, papers, args.embedding_model, device=args.device, batch_size=args.batch_size)
+    print(f'Ingested {num} new papers out of {len(papers)} into {args.db_path}')
+
+def build(args):
+    from src.database_builder import build_shards, finalize_build
+    os.makedirs(args.db_path, exist_ok=True)
+    build_shards(args.source, args.db_path, args.embedding_model, device=args.device, chunk_size=args.chunk_size, batch_size=args.batch_size)
+    num = finalize_build(args.db_path)
+    print(f'Built database with {num} papers in {args.db_path}')
+
+def split_shards(args):
+    import faiss
+    from src.ann_index import FIELDS, flat_index_path
+    from src.sharded_index import SHARD_DIR, split_index, save_shard_manifest
+
+    os.makedirs(os.path.join(args.db_path, SHARD_DIR), exist_ok=True)
+    manifest = {'factory': args.factory, 'fields': {}}
+    for field in FIELDS:
+        index = faiss.read_index(flat_index_path(args.db_path, field))
+        shards = split_index(index, args.num_shards, factory=args.factory, train_size=args.train_size)
+        manifest['fields'][field] = []
+        for i, shard in enumerate(shards):
+            rel_path = os.path.join(SHARD_DIR, f'faiss_paper_{field}_embeddings.shard{i:03d}.bin')
+            faiss.write_index(shard, os.path.join(args.db_path, rel_path))
+            manifest['fields'][field].append({'path': rel_path, 'ntotal': shard.ntotal})
+        print(f'Split {field} index of {index.ntotal} vectors into {args.num_shards} {args.factory} shards')
+    save_shard_manifest(args.db_path, manifest)
+
+def build_bm25(args):
+    from src.metadata_store import open_metadata_store
+    from src.lexical import BM25Index, BM25_DIR
+    from src.id_map import IdMap
+
+    id_map = IdMap.load(args.db_path)
+    metadata = open_metadata_store(args.db_path, args.metadata_backend)
+    start = time.time()
+    bm25 = BM25Index.build(metadata.iter_records(), id_map, len(id_map))
+    bm25.save(os.path.join(args.db_path, BM25_DIR))
+    print(f'Built BM25 index over {bm25.num_docs} papers with {len(bm25.vocab)} terms in {time.time() - start:.1f}s')
+
+def build_vectors(args):
+    import faiss
+    from src.ann_index import flat_index_path
+    from src.vector_store import build_vector_store
+    from src.embedding import cosine_similarity_rows
+
+    for field in args.fields.split(','):
+        flat = faiss.read_index(flat_index_path(args.db_path, field))
+        start = time.time()
+        store = build_vector_store(flat, args.db_path, field, format=args.format, pq_m=args.pq_m, train_size=args.train_size, seed=args.seed)
+        rows = np.random.default_rng(args.seed).choice(flat.ntotal, min(1000, flat.ntotal), replace=False)
+        fidelity = cosine_similarity_rows(store.get(rows), np.stack([flat.reconstruct(int(r)) for r in rows]))
+        print(f'Built {args.format} {field} vector store in {time.time() - start:.1f}s: {store.nbytes() / 2**20:.1f} MiB '
+              f'({flat.ntotal * flat.d * 4 / store.nbytes():.1f}x smaller than float32), mean cosine to the original vectors {fidelity.mean():.4f}')
+
+def paras_args():
+    parser = argparse.ArgumentParser(description='Maintenance tools for the paper database.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert-metadata', help='Convert arxiv_paper_db.json into the indexed SQLite store')
+    convert.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    convert.set_defaults(func=convert_metadata)
+
+    ann = subparsers.add_parser('build-ann', help='Build approximate faiss indexes from the flat ones and record them in ann_manifest.json')
+    ann.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    ann.add_argument('--variants',default='ivfpq,hnsw,sq8', type=str, help='Comma separated variants: ivfpq, ivfsq8, hnsw, sq8')
+    ann.add_argument('--fields',default='abs,title', type=str, help='Comma separated indexes to build: abs, title')
+    ann.add_argument('--nlist',default=0, type=int, help='Number of IVF lists, 0 picks 4*sqrt(n)')
+    ann.add_argument('--pq_m',default=64, type=int, help='Number of PQ sub-quantizers, must divide the embedding dimension')
+    ann.add_argument('--hnsw_m',default=32, type=int, help='Number of HNSW neighbours per node')
+    ann.add_argument('--train_size',default=100000, type=int, help='Number of vectors used to train IVF/PQ/SQ')
+    ann.add_argument('--eval_queries',default=1000, type=int, help='Number of corpus vectors used as queries for recall@k')
+    ann.add_argument('--k',default=10, type=int, help='k for recall@k')
+    ann.add_argument('--nprobe',default='1,8,32,128', type=str, help='Comma separated nprobe values to evaluate for IVF variants')
+    ann.add_argument('--ef_search',default='16,64,256', type=str, help='Comma separated efSearch values to evaluate for HNSW')
+    ann.add_argument('--seed',default=0, type=int, help='Random seed for training and query sampling')
+    ann.set_defaults(func=build_ann)
+
+    bench = subparsers.add_parser('bench-embedding', help='Compare queries/sec and retrieval drift of an embedding model variant against fp32')
+    bench.add_argument('--db_path',default='./database', type=str, help='Directory of the database, used for recall@k when the abstract index exists.')
+    bench.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    bench.add_argument('--device',default='cpu', type=str, choices=['auto', 'cuda', 'cpu'], help='Device to run the embedding model on')
+    bench.add_argument('--quantize',default='int8', type=str, help='Variant to compare against fp32: int8, or empty for fp32')
+    bench.add_argument('--num_threads',default=0, type=int, help='Number of torch threads, 0 keeps the torch default')
+    bench.add_argument('--queries',default='', type=str, help='Text file with one query per line, defaults to a built-in query set')
+    bench.add_argument('--batch_size',default=32, type=int, help='Encoding batch size')
+    bench.add_argument('--repeat',default=3, type=int, help='Number of timed passes over the query set')
+    bench.add_argument('--k',default=10, type=int, help='k for recall@k')
+    bench.set_defaults(func=bench_embedding)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Append new papers to the database without rebuilding it')
+    ingest_parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    ingest_parser.add_argument('--papers', required=True, type=str, help='JSON list, JSONL or TinyDB-style JSON file with the papers to add')
+    ingest_parser.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    ingest_parser.add_argument('--device',default='auto', type=str, choices=['auto', 'cuda', 'cpu'], help='Device to run the embedding model on')
+    ingest_parser.add_argument('--batch_size',default=32, type=int, help='Encoding batch size')
+    ingest_parser.set_defaults(func=ingest)
+
+    build_parser = subparsers.add_parser('build', help='Build the database from a paper dump in resumable, sharded steps')
+    build_parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    build_parser.add_argument('--source', required=True, type=str, help='JSONL (streamed), JSON list or TinyDB-style JSON file with the papers')
+    build_parser.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    build_parser.add_argument('--device',default='auto', type=str, choices=['auto', 'cuda', 'cpu'], help='Device to run the embedding model on')
+    build_parser.add_argument('--chunk_size',default=10000, type=int, help='Number of papers per shard')
+    build_parser.add_argument('--batch_size',default=32, type=int, help='Encoding batch size')
+    build_parser.set_defaults(func=build)
+
+    shards_parser = subparsers.add_parser('split-shards', help='Split the flat indexes into shards that are searched in parallel')
+    shards_parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    shards_parser.add_argument('--num_shards',default=4, type=int, help='Number of shards per index')
+    shards_parser.add_argument('--factory',default='Flat', type=str, help='faiss index_factory string for every shard, e.g. Flat or IVF1024,Flat')
+    shards_parser.add_argument('--train_size',default=100000, type=int, help='Number of vectors used to train each shard when the factory needs training')
+    shards_parser.set_defaults(func=split_shards)
+
+    bm25_parser = subparsers.add_parser('build-bm25', help='Build the BM25 index used by lexical and hybrid retrieval')
+    bm25_parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    bm25_parser.add_argument('--metadata_backend',default='auto', type=str, choices=['auto', 'sqlite', 'tinydb'], help='Paper metadata store to read titles and abstracts from')
+    bm25_parser.set_defaults(func=build_bm25)
+
+    vectors_parser = subparsers.add_parser('build-vectors', help='Build the compact float16 / PQ vector store used by get_vectors and MMR reranking')
+    vectors_parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    vectors_parser.add_argument('--format',default='fp16', type=str, choices=['fp16', 'pq'], help='float16 (2x smaller) or product quantization codes')
+    vectors_parser.add_argument('--fields',default='abs', type=str, help='Comma separated fields to build the store for (abs, title)')
+    vectors_parser.add_argument('--pq_m',default=64, type=int, help='Number of PQ sub-quantizers, i.e. bytes per vector')
+    vectors_parser.add_argument('--train_size',default=100000, type=int, help='Number of vectors used to train the product quantizer')
+    vectors_parser.add_argument('--seed',default=0, type=int, help='Random seed for the training sample')
+    vectors_parser.set_defaults(func=build_vectors)
+
+    args = parser.parse_args()
+    return args
+
+if __name__ == '__main__':
+
+    args = paras_args()
+
+    args.func(args)
@@ -4,9 +4,10 @@ import argparse
 import numpy as np
 from tqdm import trange,tqdm
 import threading
-from src.model import APIModel
+from src.model import APIModel, configure_scheduler, get_scheduler, configure_rate_limits, get_rate_limiter, configure_response_cache, get_response_cache, get_coalescer
 from src.utils import tokenCounter
-from src.database import database
+from src.database import add_database_args, database_from_args
+from src.retrieval_server import RemoteDatabase
 from src.agents.judge import Judge
 from tqdm import tqdm
 import time
@@ -19,8 +20,16 @@ def paras_args():
     parser.add_argument('--topic',default='', type=str, help='Topic of the survey')
     parser.add_argument('--api_url',default='https://api.openai.com/v1/chat/completions', type=str, help='url for API request')
     parser.add_argument('--api_key',default='', type=str, help='API key for the model')
-    parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
-    parser.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    parser.add_argument('--max_in_flight',default=16, type=int, help='Maximum number of LLM requests in flight at once across all agents, tune to the API quota.')
+    parser.add_argument('--rpm',default=0, type=int, help='Requests per minute allowed by the API quota, 0 reads the limit from the x-ratelimit-* response headers.')
+    parser.add_argument('--tpm',default=0, type=int, help='Tokens per minute allowed by the API quota, 0 reads the limit from the x-ratelimit-* response headers.')
+    parser.add_argument('--response_cache_path',default='', type=str, help='SQLite file caching LLM responses across runs, empty disables the cache.')
+    parser.add_argument('--response_cache_max_mb',default=1024, type=int, help='Size of the response cache before the least recently used responses are evicted.')
+    parser.add_argument('--cache_nondeterministic', action='store_true', help='Also serve temperature > 0 calls from the response cache.')
+    parser.add_argument('--batch_api', action='store_true', help='Send the citation quality NLI prompts through the offline Batch API of the provider: cheaper, but results take minutes to hours.')
+    parser.add_argument('--batch_poll_interval',default=30, type=float, help='Seconds between status checks of a submitted batch.')
+    add_database_args(parser)
+    parser.add_argument('--retrieval_server',default='', type=str, help='URL of a running retrieval_server.py, e.g. http://127.0.0.1:8765; the database is then not loaded in this process.')
     args = parser.parse_args()
 
     return args
@@ -32,12 +41,19 @@ def read_survey(path, topic):
 
 def evaluate(args):
 
-    db = database(db_path = args.db_path, embedding_model = args.embedding_model)
+    configure_scheduler(args.max_in_flight)
+    configure_rate_limits(args.rpm, args.tpm)
+    configure_response_cache(args.response_cache_path, args.response_cache_max_mb * 2**20, args.cache_nondeterministic)
+
+    if args.retrieval_server:
+        db = RemoteDatabase(args.retrieval_server)
+    else:
+        db = database_from_args(args)
 
     if not os.path.exists(args.saving_path):
         os.mkdir(args.saving_path)
 
-    judge = Judge(args.model, args.api_key, args.api_url, db)
+    judge = Judge(args.model, args.api_key, args.api_url, db, batch_api=args.batch_api, batch_poll_interval=args.batch_poll_interval)
 
     survey, references = read_survey(args.saving_path, args.topic)
 
@@ -54,6 +70,12 @@ def evaluate(args):
         result += f'Citation Recall = {recall:.4f}\nCitation Precision = {precision:.4f}\n'
         f.write(result)
 
+    print(f'LLM requests: {get_scheduler().stats()}')
+    print(f'Rate limiting: {get_rate_limiter().stats()}')
+    print(f'Coalesced duplicate requests: {get_coalescer().stats()}')
+    if get_response_cache() is not None:
+        print(f'Response cache: {get_response_cache().stats()}')
+
 if __name__ == '__main__':
 
     args = paras_args()
@@ -4,8 +4,10 @@ import argparse
 from src.agents.outline_writer import outlineWriter
 from src.agents.writer import subsectionWriter
 from src.agents.judge import Judge
-from src.database import database
+from src.database import add_database_args, database_from_args
+from src.retrieval_server import RemoteDatabase
 from src.paper_provider import PaperProvider
+from src.model import configure_scheduler, get_scheduler, configure_rate_limits, get_rate_limiter, configure_response_cache, get_response_cache, get_coalescer
 from tqdm import tqdm
 import time
 
@@ -57,15 +59,28 @@ def paras_args():
     parser.add_argument('--api_url',default='https://api.openai.com/v1/chat/completions', type=str, help='url for API request')
     parser.add_argument('--api_key',default='', type=str, help='API key for the model')
     parser.add_argument('--organization_id',default='', type=str, help='OpenAI organization ID (optional)')
-    parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
-    parser.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    parser.add_argument('--max_in_flight',default=16, type=int, help='Maximum number of LLM requests in flight at once across all agents, tune to the API quota.')
+    parser.add_argument('--rpm',default=0, type=int, help='Requests per minute allowed by the API quota, 0 reads the limit from the x-ratelimit-* response headers.')
+    parser.add_argument('--tpm',default=0, type=int, help='Tokens per minute allowed by the API quota, 0 reads the limit from the x-ratelimit-* response headers.')
+    parser.add_argument('--response_cache_path',default='', type=str, help='SQLite file caching LLM responses across runs, empty disables the cache.')
+    parser.add_argument('--response_cache_max_mb',default=1024, type=int, help='Size of the response cache before the least recently used responses are evicted.')
+    parser.add_argument('--cache_nondeterministic', action='store_true', help='Also serve temperature > 0 calls from the response cache.')
+    add_database_args(parser)
+    parser.add_argument('--retrieval_server',default='', type=str, help='URL of a running retrieval_server.py, e.g. http://127.0.0.1:8765; the database is then not loaded in this process.')
     parser.add_argument('--paper_json_path',default='', type=str, help='Path to JSON file containing pre-selected papers (optional)')
     args = parser.parse_args()
     return args
 
 def main(args):
 
-    db = database(db_path = args.db_path, embedding_model = args.embedding_model)
+    configure_scheduler(args.max_in_flight)
+    configure_rate_limits(args.rpm, args.tpm)
+    configure_response_cache(args.response_cache_path, args.response_cache_max_mb * 2**20, args.cache_nondeterministic)
+
+    if args.retrieval_server:
+        db = RemoteDatabase(args.retrieval_server)
+    else:
+        db = database_from_args(args)
     
     # 初始化paper provider（如果提供了JSON文件路径）
     paper_provider = None
@@ -94,6 +109,16 @@ def main(args):
         save_dic['reference'] = refined_references
         f.write(json.dumps(save_dic, indent=4))
 
+    print(f'LLM requests: {get_scheduler().stats()}')
+    print(f'Rate limiting: {get_rate_limiter().stats()}')
+    print(f'Coalesced duplicate requests: {get_coalescer().stats()}')
+    if get_response_cache() is not None:
+        print(f'Response cache: {get_response_cache().stats()}')
+    if not args.retrieval_server:
+        print(f'Embedding cache: {db.embedding_cache.stats()}')
+        if db.embedding_batcher is not None:
+            print(f'Embedding batcher: {db.embedding_batcher.stats()}')
+
 if __name__ == '__main__':
 
     args = paras_args()
@@ -0,0 +1,32 @@
+import argparse
+from src.database import add_database_args, database_from_args
+from src.retrieval_server import serve
+
+def paras_args():
+    parser = argparse.ArgumentParser(description='Serve the paper database to concurrent main.py / evaluation.py runs.')
+    parser.add_argument('--host',default='127.0.0.1', type=str, help='Address to listen on.')
+    parser.add_argument('--port',default=8765, type=int, help='Port to listen on.')
+    add_database_args(parser)
+    args = parser.parse_args()
+    return args
+
+def main(args):
+
+    db = database_from_args(args)
+
+    # load everything up front, so the first client does not pay for it
+    db.embedding_model
+    db.title_index.load()
+    if args.retrieval_mode != 'dense':
+        db.bm25
+    if args.retrieval_mode != 'lexical':
+        db.abs_loaded_index
+        db.title_loaded_index
+
+    serve(db, args.host, args.port)
+
+if __name__ == '__main__':
+
+    args = paras_args()
+
+    main(args)
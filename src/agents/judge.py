@@ -7,6 +7,7 @@ from tqdm import trange,tqdm
 import time
 import threading
 from src.model import APIModel
+from src.scheduler import PRIORITY_LOW
 from src.utils import tokenCounter
 from src.prompt import CRITERIA_BASED_JUDGING_PROMPT, ROUGH_OUTLINE_PROMPT, MERGING_OUTLINE_PROMPT, SUBSECTION_OUTLINE_PROMPT, EDIT_FINAL_OUTLINE_PROMPT, NLI_PROMPT
 
@@ -33,10 +34,10 @@ CRITERIA = {'Coverage':{'description':'Coverage: Coverage assesses the extent to
                                     to a comprehensive understanding of the topic.',}}
 
 class Judge():
-    def __init__(self, model:str, api_key:str, api_url:str, database = None) -> None:
+    def __init__(self, model:str, api_key:str, api_url:str, database = None, batch_api = False, batch_poll_interval = 30) -> None:
 
         self.model, self.api_key, self.api_url = model, api_key, api_url 
-        self.api_model = APIModel(self.model, self.api_key, self.api_url)
+        self.api_model = APIModel(self.model, self.api_key, self.api_url, priority=PRIORITY_LOW, batch_api=batch_api, batch_poll_interval=batch_poll_interval)
         self.db = database
 
         self.token_counter = tokenCounter()
@@ -127,42 +128,23 @@ class Judge():
             thread.join()
         return scores
     
-    def __nli(self, sources, claim, res_l, idx):
-        content_paras = {'SOURCE':'\n'.join(sources),'CLAIM':claim}
-        prompt = self.__generate_prompt(NLI_PROMPT, content_paras)
-
-        self.input_token_usage += self.token_counter.num_tokens_from_string(prompt)
-
-        res = self.api_model.chat(prompt, temperature=0)
-
-        if 'yes' in res.lower():
-            res_l[idx] += 1
-            return 1
-        else:
-            res_l[idx] += 0
-            return 0
-        
-    def __relevant(self, sources, com_sources, claim, res_l, idx):
-        content_paras = {'SOURCE':'\n'.join(sources),'CLAIM':claim}
-        prompt = self.__generate_prompt(NLI_PROMPT, content_paras)
-        self.input_token_usage += self.token_counter.num_tokens_from_string(prompt)
-
-        res = self.api_model.chat(prompt, temperature=0)
-
-        if 'yes' in res.lower():
-            res_l[idx] += 1
-            return 1
-        else:
-            content_paras = {'SOURCE':'\n'.join(com_sources),'CLAIM':claim}
+    def __batch_nli(self, pairs):
+        '''
+        pairs: [(sources, claim)]; returns whether each claim is supported by its sources, with all NLI prompts sent
+        as one batch_chat. Items that failed (e.g. expired in the Batch API) are retried with chat, and are None when
+        that fails too.
+        '''
+        prompts = []
+        for sources, claim in pairs:
+            content_paras = {'SOURCE':'\n'.join(sources),'CLAIM':claim}
             prompt = self.__generate_prompt(NLI_PROMPT, content_paras)
             self.input_token_usage += self.token_counter.num_tokens_from_string(prompt)
-            res = self.api_model.chat(prompt, temperature=0)
-            if 'yes' in res.lower():
-                res_l[idx] += 0
-                return 0
-            else:
-                res_l[idx] += 1
-                return 1
+            prompts.append(prompt)
+        responses = self.api_model.batch_chat(prompts, temperature=0) if prompts else []
+        for i, res in enumerate(responses):
+            if res is None:
+                responses[i] = self.api_model.chat(prompts[i], temperature=0)
+        return [None if res is None else 'yes' in res.lower() for res in responses]
       
     def citation_quality(self, survey_with_reference, references):
         survey = survey_with_reference.split('## References')[0]
@@ -195,30 +177,27 @@ class Judge():
         index_to_paper = {int(index): ids_to_paper[idx] for index, idx in references.items()}
         index_to_titles = {int(index): ids_to_title[idx] for index, idx in references.items()}
 
-        thread_l = []
-        scores = [0] * len(claims)
-        for i in range(len(claims)):
-            sources = [index_to_paper[index] for index in sources_ids[i]]
-            thread = threading.Thread(target=self.__nli, args=(sources, claims[i], scores, i))
-            thread_l.append(thread)
-            thread.start()
-        for thread in tqdm(thread_l):
-            thread.join()
-        citation_num = 0
-        thread_l = []
-        precisions = [0] * len(claims)
-        for j, claim, source_ids in zip(range(len(claims)), claims, sources_ids):
-            citation_num += len(source_ids)
-            if scores[j] == 1:
-                for index in source_ids:
-                    sources = [index_to_paper[index]]
-                    com_sources = [index_to_paper[_] for _ in source_ids if not _ == index]
-                    thread = threading.Thread(target=self.__relevant, args=(sources, com_sources, claim, precisions, j))
-                    thread_l.append(thread)
-                    thread.start()
-        for thread in tqdm(thread_l):
-            thread.join()
+        # recall: is each claim supported by all of its cited sources
+        scores = self.__batch_nli([([index_to_paper[index] for index in sources_ids[i]], claims[i]) for i in range(len(claims))])
 
+        # precision: a citation of a supported claim is relevant if it supports the claim on its own, or if the other
+        # citations alone do not
+        citation_num = sum(len(source_ids) for source_ids, score in zip(sources_ids, scores) if score is not None)
+        citations = [(j, index) for j, source_ids in enumerate(sources_ids) if scores[j] for index in source_ids]
+        alone = self.__batch_nli([([index_to_paper[index]], claims[j]) for j, index in citations])
+        rest = [c for c, supported in zip(citations, alone) if supported is False]
+        rest_supported = self.__batch_nli([([index_to_paper[_] for _ in sources_ids[j] if not _ == index], claims[j]) for j, index in rest])
+        precisions = [0] * len(claims)
+        for (j, index), supported in zip(citations, alone):
+            precisions[j] += int(supported is True)
+        for (j, index), supported in zip(rest, rest_supported):
+            precisions[j] += int(supported is False)
+
+        # judgements that failed even after retrying are left out of the denominators instead of counting as unsupported
+        failed = sum(_ is None for _ in scores + alone + rest_supported)
+        citation_num -= sum(_ is None for _ in alone + rest_supported)
+        if failed:
+            print(f'Citation quality: {failed} NLI judgements failed after retrying and were left out of recall and precision')
         precisions = np.array(precisions)
 
-        return np.array(scores).mean(), precisions.sum()/citation_num
+        return np.array([int(_) for _ in scores if _ is not None]).mean(), precisions.sum()/citation_num
@@ -1,6 +1,7 @@
 import os
 import re
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from tqdm import trange,tqdm
 import torch
@@ -25,25 +26,24 @@ class subsectionWriter():
         self.paper_provider = paper_provider  # 新增的paper provider
         self.token_counter = tokenCounter()
         self.input_token_usage, self.output_token_usage = 0, 0
+        # citation -> paper id, filled while the subsections are still streaming
+        self.resolved_citations = {}
+        self.citation_stats = {'citations': 0, 'hash_hits': 0, 'fallback_seconds': 0.0, 'seconds_saved': None}
+        self.citation_lock = threading.Lock()
 
     def write(self, topic, outline, rag_num = 30, subsection_len = 500, refining = True, reflection=True):
+        # citation resolution is reported per survey
+        with self.citation_lock:
+            self.resolved_citations = {}
+            self.citation_stats = {'citations': 0, 'hash_hits': 0, 'fallback_seconds': 0.0, 'seconds_saved': None}
         # Get database
         parsed_outline = self.parse_outline(outline=outline)
         section_content = [[]] * len(parsed_outline['sections'])
 
-        section_paper_texts = [[]] *  len(parsed_outline['sections'])
+        section_paper_texts = [[] for _ in parsed_outline['sections']]
         
-        total_ids = []
-        section_references_ids = [[]] * len(parsed_outline['sections'])
-        for i in range(len(parsed_outline['sections'])):
-            descriptions = parsed_outline['subsection_descriptions'][i]
-            for d in descriptions:
-                if self.paper_provider is not None:
-                    references_ids = self.paper_provider.get_papers_by_query(d, num = rag_num, shuffle = False)
-                else:
-                    references_ids = self.db.get_ids_from_query(d, num = rag_num, shuffle = False)
-                total_ids += references_ids
-                section_references_ids[i].append(references_ids)
+        section_references_ids = self.retrieve_references(parsed_outline, rag_num)
+        total_ids = [_ for references in section_references_ids for references_ids in references for _ in references_ids]
         
         if self.paper_provider is not None:
             total_references_infos = self.paper_provider.get_paper_info_from_ids(list(set(total_ids)))
@@ -82,6 +82,25 @@ class subsectionWriter():
         else:
             return raw_survey+'\n', raw_survey_with_references+'\n', raw_references#, mindmap
 
+    def retrieve_references(self, parsed_outline, rag_num):
+        '''
+        Reference ids of every subsection, grouped by section.
+        '''
+        section_references_ids = [[] for _ in parsed_outline['sections']]
+        if self.paper_provider is None:
+            # retrieve for every subsection description of the outline with one encode and one faiss search
+            all_descriptions = [d for descriptions in parsed_outline['subsection_descriptions'] for d in descriptions]
+            all_references_ids = iter(self.db.get_ids_from_queries(all_descriptions, num = rag_num, shuffle = False))
+        for i in range(len(parsed_outline['sections'])):
+            descriptions = parsed_outline['subsection_descriptions'][i]
+            for d in descriptions:
+                if self.paper_provider is not None:
+                    references_ids = self.paper_provider.get_papers_by_query(d, num = rag_num, shuffle = False)
+                else:
+                    references_ids = next(all_references_ids)
+                section_references_ids[i].append(references_ids)
+        return section_references_ids
+
     def compute_price(self):
         return self.token_counter.compute_price(input_tokens=self.input_token_usage, output_tokens=self.output_token_usage, model=self.model)
 
@@ -144,13 +163,50 @@ class subsectionWriter():
         for content, paper_texts in zip(contents, paper_texts_l):
             prompts.append(self.__generate_prompt(CHECK_CITATION_PROMPT, paras={'SUBSECTION': content, 'TOPIC':topic, 'PAPER LIST':paper_texts}))
         self.input_token_usage += self.token_counter.num_tokens_from_list_string(prompts)
-        contents = self.api_model.batch_chat(prompts, temperature=1)
+        # the final pass is streamed, so its citations are resolved while the rest of the text is still generated
+        with ThreadPoolExecutor(max_workers=max(1, len(prompts))) as pool:
+            contents = list(pool.map(self.stream_with_citations, prompts))
         self.output_token_usage += self.token_counter.num_tokens_from_list_string(contents)
         contents = [c.replace('<format>','').replace('</format>','') for c in contents]
     
         res_l[idx] = contents
         return contents
         
+    def stream_with_citations(self, prompt):
+        '''
+        Stream a subsection and resolve every citation as soon as its closing bracket arrives. A stream that fails or
+        comes back empty is requested again without streaming.
+        '''
+        text = ''
+        try:
+            for delta in self.api_model.stream_chat(prompt, temperature=1):
+                text += delta
+                if ']' in delta:
+                    self.resolve_citations(self.extract_citations(text))
+        except Exception as e:
+            print(f'Streaming the subsection failed ({e}), requesting it again without streaming')
+            text = ''
+        if not text.strip():
+            text = self.api_model.chat(prompt, temperature=1)
+            if not text:
+                raise RuntimeError('The citation check of a subsection returned no text')
+        return text
+
+    def resolve_citations(self, citations):
+        with self.citation_lock:
+            new = [c for c in citations if c not in self.resolved_citations]
+        if new:
+            ids = self.db.get_titles_from_citations(new)
+            # last_citation_stats belongs to this thread's call
+            stats = getattr(self.db, 'last_citation_stats', None)
+            with self.citation_lock:
+                self.resolved_citations.update(zip(new, ids))
+                if stats:
+                    for k in ['citations', 'hash_hits', 'fallback_seconds']:
+                        self.citation_stats[k] += stats[k]
+                    if stats['seconds_saved'] is not None:
+                        self.citation_stats['seconds_saved'] = (self.citation_stats['seconds_saved'] or 0.0) + stats['seconds_saved']
+
     def __generate_prompt(self, template, paras):
         prompt = template
         for k in paras.keys():
@@ -319,7 +375,18 @@ class subsectionWriter():
 
     def replace_citations_with_numbers(self, citations, markdown_text):
 
-        ids = self.db.get_titles_from_citations(citations)
+        with self.citation_lock:
+            unresolved = [c for c in citations if c not in self.resolved_citations]
+        print(f"Citation resolution: {len(citations) - len(unresolved)}/{len(citations)} citations resolved while streaming")
+        self.resolve_citations(unresolved)
+        with self.citation_lock:
+            ids = [self.resolved_citations[c] for c in citations]
+            stats = dict(self.citation_stats)
+        # totals of this survey so far, streamed subsections included
+        if stats['citations']:
+            saved = f"{stats['seconds_saved']:.2f}s" if stats['seconds_saved'] is not None else 'n/a'
+            print(f"Citation resolution: {stats['hash_hits']}/{stats['citations']} exact title hits ({stats['hash_hits'] / stats['citations']:.1%}), "
+                  f"{stats['fallback_seconds']:.2f}s in embedding search, ~{saved} saved")
 
         citation_to_ids = {citation: idx for citation, idx in zip(citations, ids)}
 
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import numpy as np
+import faiss
+
+ANN_DIR = 'ann'
+MANIFEST_FILE = 'ann_manifest.json'
+FIELDS = ['abs', 'title']
+
+# faiss index_factory strings for the supported approximate variants
+VARIANTS = {
+    'ivfpq': 'IVF{nlist},PQ{pq_m}',
+    'ivfsq8': 'IVF{nlist},SQ8',
+    'hnsw': 'HNSW{hnsw_m},Flat',
+    'sq8': 'SQ8',
+}
+
+def flat_index_path(db_path, field):
+    return f'{db_path}/faiss_paper_{field}_embeddings.bin'
+
+def load_manifest(db_path):
+    path = os.path.join(db_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'variants': {}}
+    with open(path, 'r') as f:
+        return json.loads(f.read())
+
+def save_manifest(db_path, manifest):
+    path = os.path.join(db_path, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def variant_path(db_path, variant, field):
+    manifest = load_manifest(db_path)
+    if variant not in manifest['variants']:
+        raise KeyError(f'Index variant {variant} not found in {os.path.join(db_path, MANIFEST_FILE)}')
+    return os.path.join(db_path, manifest['variants'][variant]['files'][field])
+
+def default_nlist(ntotal):
+    # the usual 4*sqrt(n) rule, capped so that every list gets at least 39 training points
+    return max(1, min(int(4 * np.sqrt(ntotal)), ntotal // 39))
+
+def is_hnsw(index):
+    return isinstance(faiss.downcast_index(index), faiss.IndexHNSW)
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    ps = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        ps.set_index_parameter(index, 'nprobe', nprobe)
+    if ef_search is not None and is_hnsw(index):
+        ps.set_index_parameter(index, 'efSearch', ef_search)
+    return index
+
+def mmap_io_flags(path):
+    # IO_FLAG_MMAP maps the inverted lists of IVF indexes and IO_FLAG_MMAP_IFC (newer faiss) the codes of the other
+    # index types; faiss rejects IVF files read with both, so the flag is picked from the index fourcc
+    with open(path, 'rb') as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b'Iw') or not hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+        return faiss.IO_FLAG_MMAP
+    return faiss.IO_FLAG_MMAP_IFC
+
+def read_index(path, mmap=False, nprobe=None, ef_search=None):
+    index = faiss.read_index(path, mmap_io_flags(path) if mmap else 0)
+    return set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+def enable_reconstruct(index):
+    # IVF indexes can only reconstruct vectors by row once they have a row -> inverted list map
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        ivf.make_direct_map()
+    return index
+
+def reconstruct_rows(index, rows):
+    # one call into faiss for the whole batch; faiss < 1.7.3 only has reconstruct by single row
+    rows = np.ascontiguousarray(rows, dtype='int64')
+    if hasattr(index, 'reconstruct_batch'):
+        return index.reconstruct_batch(rows)
+    return np.stack([index.reconstruct(int(r)) for r in rows])
+
+def build_variant(vectors, factory, metric, train_size=100000, seed=0, add_batch=100000):
+    index = faiss.index_factory(vectors.shape[1], factory, metric)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(train_size, len(vectors)), replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+    for start in range(0, len(vectors), add_batch):
+        index.add(np.ascontiguousarray(vectors[start:start + add_batch], dtype='float32'))
+    return index
+
+def evaluate_recall(flat_index, index, queries, k=10, nprobe=None, ef_search=None):
+    '''
+    recall@k of the approximate index against the exact results of the flat index, plus the search latency of both.
+    '''
+    start = time.time()
+    _, truth = flat_index.search(queries, k)
+    flat_ms = (time.time() - start) * 1000 / len(queries)
+
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    start = time.time()
+    _, found = index.search(queries, k)
+    ann_ms = (time.time() - start) * 1000 / len(queries)
+
+    hits = sum(len(set(t[t != -1]) & set(f[f != -1])) for t, f in zip(truth, found))
+    return {'k': k, 'nprobe': nprobe, 'ef_search': ef_search, 'recall': hits / (k * len(queries)),
+            'ms_per_query': ann_ms, 'flat_ms_per_query': flat_ms}
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+from urllib.parse import urlsplit
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+def batch_base_url(api_url):
+    '''
+    https://host/v1/chat/completions -> (https://host/v1, /v1/chat/completions): where the files and batches endpoints
+    live, and the endpoint every request of the batch targets.
+    '''
+    endpoint = urlsplit(api_url).path or '/v1/chat/completions'
+    base = api_url[:api_url.rindex('/chat/completions')] if '/chat/completions' in api_url else api_url.rstrip('/')
+    return base, endpoint
+
+def write_batch_file(bodies, endpoint, directory=None):
+    fd, path = tempfile.mkstemp(prefix='batch_', suffix='.jsonl', dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        for i, body in enumerate(bodies):
+            f.write(json.dumps({'custom_id': str(i), 'method': 'POST', 'url': endpoint, 'body': body}) + '\n')
+    return path
+
+def read_batch_results(text, num):
+    '''
+    Map the output lines of a batch back to request order by custom_id; requests without a successful result get None.
+    '''
+    results = [None] * num
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get('response') or {}
+        if response.get('status_code') != 200:
+            continue
+        try:
+            results[int(record['custom_id'])] = response['body']['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+    return results
+
+async def run_batch(client, api_url, headers, bodies, poll_interval=30, completion_window='24h', batch_dir=None, timeout=None):
+    '''
+    Run chat completion requests through an OpenAI-style Batch API: write them to a JSONL file, upload it, create the
+    batch, poll until it reaches a terminal status and return the response texts in request order.
+    '''
+    base, endpoint = batch_base_url(api_url)
+    path = write_batch_file(bodies, endpoint, batch_dir)
+    headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
+    with open(path, 'rb') as f:
+        upload = await client.post(f'{base}/files', headers=headers, data={'purpose': 'batch'}, files={'file': (os.path.basename(path), f, 'application/jsonl')})
+    upload.raise_for_status()
+    if batch_dir is None:
+        # only batch_dir keeps the request files around for inspection
+        os.remove(path)
+    batch = await client.post(f'{base}/batches', headers=headers, json={'input_file_id': upload.json()['id'], 'endpoint': endpoint, 'completion_window': completion_window})
+    batch.raise_for_status()
+    batch = batch.json()
+    print(f"Submitted batch {batch['id']} with {len(bodies)} requests")
+    start = time.monotonic()
+    while batch['status'] not in TERMINAL_STATUSES:
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {batch['id']} did not finish within {timeout}s (status {batch['status']})")
+        await asyncio.sleep(poll_interval)
+        response = await client.get(f"{base}/batches/{batch['id']}", headers=headers)
+        response.raise_for_status()
+        batch = response.json()
+    print(f"Batch {batch['id']} {batch['status']} after {time.monotonic() - start:.0f}s: {batch.get('request_counts')}")
+    if not batch.get('output_file_id'):
+        return [None] * len(bodies)
+    output = await client.get(f"{base}/files/{batch['output_file_id']}/content", headers=headers)
+    output.raise_for_status()
+    return read_batch_results(output.text, len(bodies))
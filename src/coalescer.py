@@ -0,0 +1,33 @@
+import asyncio
+
+class RequestCoalescer():
+    '''
+    Runs at most one request per key at a time: a caller asking for a key that is already in flight waits for the
+    first caller's result instead of sending the same request again. Like the scheduler, it is only touched from the
+    event loop the requests run on.
+    '''
+
+    def __init__(self) -> None:
+        self._in_flight = {}
+        self.requests, self.coalesced = 0, 0
+
+    async def run(self, key, coro_fn):
+        self.requests += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # a cancelled caller must not cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    def count(self, requests, coalesced):
+        # duplicates removed before reaching run, e.g. within one Batch API submission
+        self.requests += requests
+        self.coalesced += coalesced
+
+    def stats(self):
+        return {'requests': self.requests, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight),
+                'coalesced_rate': self.coalesced / self.requests if self.requests else 0.0}
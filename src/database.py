@@ -1,111 +1,330 @@
 import os
+import time
 import numpy as np
-import torch
-from transformers import AutoModel, AutoTokenizer,  AutoModelForSequenceClassification
-from sentence_transformers import SentenceTransformer
-import h5py
+from src.embedding import load_embedding_model
+from src.embedding_cache import EmbeddingCache
+from src.embedding_batcher import EmbeddingBatcher
 from src.utils import tokenCounter
 import json
-from tqdm import tqdm
-import faiss
-from tinydb import TinyDB, Query
+import threading
+from src.metadata_store import open_metadata_store
+from src.paper_content import PaperContentStore
+from src.ann_index import flat_index_path, variant_path, read_index, enable_reconstruct, reconstruct_rows
+from src.sharded_index import ShardedIndex, load_shard_manifest
+from src.title_index import TitleHashIndex
+from src.lexical import BM25Index, BM25_DIR, reciprocal_rank_fusion
+from src.filters import RowAttributes, compile_filters, filtered_search
+from src.id_map import IdMap
+from src.mmr import mmr_select
+from src.vector_store import VectorStore, load_vector_manifest
 
 class database():
 
-    def __init__(self, db_path, embedding_model) -> None:
+    def __init__(self, db_path, embedding_model, metadata_backend='auto', faiss_mmap=False, index_variant=None, nprobe=None, ef_search=None, paper_content_path='./paper_content.h5', device='auto', quantize=None, num_threads=None, embedding_cache_path=None, sharded=False, shard_workers=None, retrieval_mode='dense', hybrid_depth=2, mmr_lambda=1.0, mmr_pool=3, embedding_batch_window=0.005, embedding_max_batch=64) -> None:
         
-        self.embedding_model = SentenceTransformer(embedding_model, trust_remote_code=True)
+        # the encoder is loaded on first use, lexical-only retrieval never needs it
+        self.embedding_model_args = {'embedding_model': embedding_model, 'device': device, 'quantize': quantize, 'num_threads': num_threads}
+        self._embedding_model = None
+        self._bm25 = None
+        self._row_attributes = None
+        self._filter_cache = {}
+        self.retrieval_mode, self.hybrid_depth = retrieval_mode, hybrid_depth
+        # mmr_lambda < 1 reranks a pool of num * mmr_pool candidates for diversity, 1 keeps the plain ranking
+        if mmr_lambda < 1 and retrieval_mode == 'lexical':
+            # the similarity terms need the query and paper embeddings, which lexical mode exists to avoid
+            raise ValueError('MMR reranking (mmr_lambda < 1) needs dense embeddings, use it with retrieval_mode dense or hybrid')
+        self.mmr_lambda, self.mmr_pool = mmr_lambda, mmr_pool
+        model_key = f'{embedding_model}:{quantize}' if quantize else embedding_model
+        self.embedding_cache = EmbeddingCache(model_key, cache_path=embedding_cache_path)
+        # cache misses from concurrent writer threads are encoded together instead of as many batches of one
+        self.embedding_batcher = None
+        if embedding_batch_window and embedding_batch_window > 0:
+            self.embedding_batcher = EmbeddingBatcher(lambda texts: self.embedding_model.encode(texts), embedding_batch_window, embedding_max_batch)
 
-        self.embedding_model.to(torch.device('cuda'))
+        self.metadata = open_metadata_store(db_path, metadata_backend)
+        self.title_index = TitleHashIndex(db_path, self.metadata)
+        self.citation_stats = {'citations': 0, 'hash_hits': 0, 'fallback_seconds': 0.0}
+        # writer threads resolve citations concurrently, each reads the stats of its own last call
+        self._citation_stats_lock = threading.Lock()
+        self._citation_local = threading.local()
 
-        self.db = TinyDB(f'{db_path}/arxiv_paper_db.json')
-        self.table = self.db.table('cs_paper_info')
-
-        self.User = Query()
         self.token_counter = tokenCounter()
-        self.title_loaded_index = faiss.read_index(f'{db_path}/faiss_paper_title_embeddings.bin')
+        self.paper_content = PaperContentStore(paper_content_path)
 
-        self.abs_loaded_index = faiss.read_index(f'{db_path}/faiss_paper_abs_embeddings.bin')
-        self.id_to_index, self.index_to_id = self.load_index_arxivid(db_path)
+        # faiss indexes are read on first search, so a run only pays for the indexes it actually queries
+        self.db_path = db_path
+        self.faiss_mmap = faiss_mmap
+        self.index_variant, self.nprobe, self.ef_search = index_variant, nprobe, ef_search
+        self.sharded, self.shard_workers = sharded, shard_workers
+        self._indexes = {}
+        self._reconstructable = set()
+        self._vector_stores = {}
+        self._index_lock = threading.Lock()
+        self.id_map = IdMap.load(db_path)
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._index_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = load_embedding_model(**self.embedding_model_args)
+        return self._embedding_model
+
+    @property
+    def bm25(self):
+        if self._bm25 is None:
+            with self._index_lock:
+                if self._bm25 is None:
+                    self._bm25 = self.load_bm25()
+        return self._bm25
+
+    def load_bm25(self):
+        path = os.path.join(self.db_path, BM25_DIR)
+        num_rows = len(self.id_map)
+        if os.path.exists(os.path.join(path, 'postings.npz')):
+            bm25 = BM25Index.load(path)
+            if len(bm25.doc_len) == num_rows:
+                return bm25
+        print(f'Building BM25 index over {num_rows} papers in {path}')
+        bm25 = BM25Index.build(self.metadata.iter_records(), self.id_map, num_rows)
+        bm25.save(path)
+        return bm25
+
+    @property
+    def row_attributes(self):
+        if self._row_attributes is None:
+            with self._index_lock:
+                if self._row_attributes is None:
+                    self._row_attributes = RowAttributes(self.metadata.iter_records(), self.id_map, len(self.id_map))
+        return self._row_attributes
+
+    def rows_from_filters(self, filters):
+        '''
+        filters: {'date_from': str, 'date_to': str, 'ids': [...], 'categories': [...]}, any subset. Returns the sorted
+        eligible faiss rows, or None when nothing is filtered.
+        '''
+        if not filters:
+            return None
+        key = json.dumps(filters, sort_keys=True)
+        rows = self._filter_cache.get(key)
+        if rows is None:
+            rows = compile_filters(filters, self.row_attributes, self.id_map)
+            if len(self._filter_cache) >= 128:
+                self._filter_cache.pop(next(iter(self._filter_cache)))
+            self._filter_cache[key] = rows
+        return rows
+
+    def index_search(self, index, query_vectors, top_k, rows=None):
+        if rows is None:
+            return index.search(query_vectors, top_k)
+        if isinstance(index, ShardedIndex):
+            return index.search(query_vectors, top_k, rows=rows)
+        return filtered_search(index, query_vectors, top_k, rows)
+
+    @property
+    def title_loaded_index(self):
+        return self.load_index('title')
+
+    @property
+    def abs_loaded_index(self):
+        return self.load_index('abs')
+
+    def index_path(self, field):
+        if self.index_variant:
+            return variant_path(self.db_path, self.index_variant, field)
+        return flat_index_path(self.db_path, field)
+
+    def load_index(self, field):
+        index = self._indexes.get(field)
+        if index is None:
+            with self._index_lock:
+                index = self._indexes.get(field)
+                if index is None:
+                    if self.sharded:
+                        paths = [os.path.join(self.db_path, _['path']) for _ in load_shard_manifest(self.db_path)['fields'][field]]
+                        index = ShardedIndex([self.read_index(_) for _ in paths], num_workers=self.shard_workers)
+                    else:
+                        index = self.read_index(self.index_path(field))
+                    self._indexes[field] = index
+        return index
+
+    def read_index(self, path):
+        return read_index(path, mmap=self.faiss_mmap, nprobe=self.nprobe, ef_search=self.ef_search)
+
+    def encode(self, batch_text):
+        if self.embedding_batcher is not None:
+            return self.embedding_cache.get_or_compute(batch_text, self.embedding_batcher.encode)
+        return self.embedding_cache.get_or_compute(batch_text, self.embedding_model.encode)
 
-    def load_index_arxivid(self, db_path):
-        with open(f'{db_path}/arxivid_to_index_abs.json','r') as f:
-            id_to_index = json.loads(f.read())
-        id_to_index = {id: int(index) for id, index in id_to_index.items()}
-        index_to_id = {int(index): id for id, index in id_to_index.items()}
-        return id_to_index, index_to_id
-    
     def get_embeddings(self, batch_text):
         batch_text = ['search_query: ' + _ for _ in batch_text]
-        embeddings = self.embedding_model.encode(batch_text)
+        embeddings = self.encode(batch_text)
         return embeddings
 
     def get_embeddings_documents(self, batch_text):
         batch_text = ['search_document: ' + _ for _ in batch_text]
-        embeddings = self.embedding_model.encode(batch_text)
+        embeddings = self.encode(batch_text)
         return embeddings
         
-    def batch_search(self, query_vectors, top_k=1, title=False):
+    def batch_search(self, query_vectors, top_k=1, title=False, filters=None):
         query_vectors = np.array(query_vectors).astype('float32')
+        rows = self.rows_from_filters(filters)
         if title:
-            distances, indices = self.title_loaded_index.search(query_vectors, top_k)
+            distances, indices = self.index_search(self.title_loaded_index, query_vectors, top_k, rows)
         else:
-            distances, indices = self.abs_loaded_index.search(query_vectors, top_k)
-        results = []
-        for i, query in tqdm(enumerate(query_vectors)):
-            result = [(self.index_to_id[idx], distances[i][j]) for j, idx in enumerate(indices[i]) if idx != -1]
-            results.append([_[0] for _ in result])
-        return results
+            distances, indices = self.index_search(self.abs_loaded_index, query_vectors, top_k, rows)
+        return [self.id_map.ids(row[row != -1]) for row in indices]
 
-    def search(self, query_vector, top_k=1, title=False):
+    def search(self, query_vector, top_k=1, title=False, filters=None):
         query_vector = np.array([query_vector]).astype('float32')
+        rows = self.rows_from_filters(filters)
         if title:
-            distances, indices = self.title_loaded_index.search(query_vector, top_k)
+            distances, indices = self.index_search(self.title_loaded_index, query_vector, top_k, rows)
         else:
-            distances, indices = self.abs_loaded_index.search(query_vector, top_k)
-        results = [(self.index_to_id[idx], distances[0][i]) for i, idx in enumerate(indices[0]) if idx != -1]
-        return [_[0] for _ in results]
+            distances, indices = self.index_search(self.abs_loaded_index, query_vector, top_k, rows)
+        return self.id_map.ids(indices[0][indices[0] != -1])
 
-    def get_ids_from_query(self, query, num,  shuffle = False):
+    def get_ids_from_query(self, query, num,  shuffle = False, filters = None):
+        if self.retrieval_mode != 'dense' or self.mmr_lambda < 1:
+            return self.get_ids_from_queries([query], num, shuffle, filters)[0]
         q = self.get_embeddings([query])[0]
-        return self.search(q, top_k=num)
+        return self.search(q, top_k=num, filters=filters)
     
+    def lexical_search(self, query, num, filters = None):
+        return self.id_map.ids(self.bm25.search(query, num, rows=self.rows_from_filters(filters)))
+
     def get_titles_from_citations(self, citations):
-        q = self.get_embeddings_documents(citations)
-        ids = self.batch_search(q,1, True)
-        return [_[0] for _ in ids]
+        # cited titles are usually exact, only the ones missing from the title hash go through the encoder
+        ids = [self.title_index.lookup(c) for c in citations]
+        unresolved = [i for i, _ in enumerate(ids) if _ is None]
+        fallback_seconds = 0.0
+        if unresolved:
+            start = time.time()
+            q = self.get_embeddings_documents([citations[i] for i in unresolved])
+            found = self.batch_search(q,1, True)
+            fallback_seconds = time.time() - start
+            for i, r in zip(unresolved, found):
+                ids[i] = r[0]
+        self.record_citation_stats(len(citations), len(citations) - len(unresolved), fallback_seconds)
+        return ids
+
+    def record_citation_stats(self, num_citations, hash_hits, fallback_seconds):
+        with self._citation_stats_lock:
+            self.citation_stats['citations'] += num_citations
+            self.citation_stats['hash_hits'] += hash_hits
+            self.citation_stats['fallback_seconds'] += fallback_seconds
+            fallbacks = self.citation_stats['citations'] - self.citation_stats['hash_hits']
+            # time saved is estimated from the average cost of the citations that did need the encoder
+            per_citation = self.citation_stats['fallback_seconds'] / fallbacks if fallbacks else None
+        self._citation_local.last_citation_stats = {'citations': num_citations, 'hash_hits': hash_hits,
+                                                    'hit_rate': hash_hits / num_citations if num_citations else 0.0,
+                                                    'fallback_seconds': fallback_seconds,
+                                                    'seconds_saved': hash_hits * per_citation if per_citation is not None else None}
+
+    @property
+    def last_citation_stats(self):
+        return getattr(self._citation_local, 'last_citation_stats', None)
+
+    def get_ids_from_queries(self, queries, num,  shuffle = False, filters = None):
+        if self.mmr_lambda >= 1:
+            return self.retrieve(queries, num, filters)
+        pools = self.retrieve(queries, num * self.mmr_pool, filters)
+        return self.diversify(self.get_embeddings(queries), pools, num)
 
-    def get_ids_from_queries(self, queries, num,  shuffle = False):
+    def retrieve(self, queries, num, filters = None):
+        if self.retrieval_mode == 'lexical':
+            return [self.lexical_search(query, num, filters) for query in queries]
         q = self.get_embeddings(queries)
-        ids = self.batch_search(q,num)
+        if self.retrieval_mode == 'hybrid':
+            # reciprocal rank fusion of deeper dense and BM25 rankings
+            depth = num * self.hybrid_depth
+            dense_ids = self.batch_search(q, depth, filters=filters)
+            return [reciprocal_rank_fusion([d, self.lexical_search(query, depth, filters)], num) for d, query in zip(dense_ids, queries)]
+        ids = self.batch_search(q,num, filters=filters)
         return ids
+
+    def diversify(self, query_vectors, pools, num):
+        # maximal marginal relevance over the abstract embeddings of each candidate pool
+        results = []
+        for q, ids in zip(query_vectors, pools):
+            if len(ids) <= 1:
+                results.append(ids[:num])
+                continue
+            picked = mmr_select(q, self.get_vectors(ids), num, self.mmr_lambda)
+            results.append([ids[i] for i in picked])
+        return results
+
+    def vector_store(self, field):
+        if field not in self._vector_stores:
+            with self._index_lock:
+                if field not in self._vector_stores:
+                    store = None
+                    if field in load_vector_manifest(self.db_path):
+                        store = VectorStore(self.db_path, field)
+                        if len(store) != len(self.id_map):
+                            print(f'Warning: {store.path} holds {len(store)} vectors for {len(self.id_map)} papers and is ignored, rebuild it with `db_tools.py build-vectors`')
+                            store = None
+                    self._vector_stores[field] = store
+        return self._vector_stores[field]
+
+    def get_vectors(self, ids, title=False):
+        '''
+        Embeddings of the given papers, from the compact side store when one was built (db_tools.py build-vectors),
+        otherwise reconstructed from the loaded abstract (or title) index. Approximate variants and PQ stores return
+        decoded, approximate vectors.
+        '''
+        rows = self.id_map.rows(ids)
+        if (rows == -1).any():
+            raise KeyError(f'Papers not found in the database: {[i for i, r in zip(ids, rows) if r == -1]}')
+        store = self.vector_store('title' if title else 'abs')
+        if store is not None and len(rows):
+            return store.get(rows)
+        index = self.title_loaded_index if title else self.abs_loaded_index
+        if id(index) not in self._reconstructable:
+            with self._index_lock:
+                for part in getattr(index, 'shards', [index]):
+                    enable_reconstruct(part)
+                self._reconstructable.add(id(index))
+        return reconstruct_rows(index, rows) if len(rows) else np.zeros((0, index.d), dtype='float32')
     
     def get_date_from_ids(self, ids):
-        result = self.table.search(self.User.id.one_of(ids))
-        dates = [r['date'] for r in result]
-        return dates
+        return [r['date'] for r in self.metadata.get(ids)]
 
     def get_title_from_ids(self, ids):
-        result = self.table.search(self.User.id.one_of(ids))
-        titles = [r['title'] for r in result]
-        return titles
+        return [r['title'] for r in self.metadata.get(ids)]
 
     def get_abs_from_ids(self, ids):
-        result = self.table.search(self.User.id.one_of(ids))
-        abs_l = [r['abs'] for r in result]
-        return abs_l
+        return [r['abs'] for r in self.metadata.get(ids)]
 
     def get_paper_info_from_ids(self, ids):
-        result = self.table.search(self.User.id.one_of(ids))
-        return result
+        return self.metadata.get(ids)
     
     def get_paper_from_ids(self, ids, max_len = 1500):
-        loaded_data = {}
-        with h5py.File('./paper_content.h5', 'r') as f:
-            for key in f.keys():
-                if key in ids:
-                    loaded_data[key] = str(f[key][()])
-                if len(ids) == len(loaded_data):
-                    break
-        print(loaded_data[list(loaded_data.keys())[0]])
-        return [self.token_counter.text_truncation(loaded_data[_], max_len) for _ in ids]
\ No newline at end of file
+        return [self.token_counter.text_truncation(t, max_len) for t in self.paper_content.get(ids)]
+
+def add_database_args(parser):
+    '''
+    The database flags shared by main.py, evaluation.py and retrieval_server.py.
+    '''
+    parser.add_argument('--db_path',default='./database', type=str, help='Directory of the database.')
+    parser.add_argument('--embedding_model',default='nomic-ai/nomic-embed-text-v1', type=str, help='Embedding model for retrieval.')
+    parser.add_argument('--metadata_backend',default='auto', type=str, choices=['auto', 'sqlite', 'tinydb'], help='Paper metadata store, auto uses SQLite when arxiv_paper_db.sqlite exists.')
+    parser.add_argument('--faiss_mmap', action='store_true', help='Memory-map the faiss indexes instead of reading them into RAM.')
+    parser.add_argument('--index_variant',default='', type=str, help='Approximate index variant from ann_manifest.json, empty uses the flat indexes.')
+    parser.add_argument('--nprobe',default=None, type=int, help='Number of IVF lists to visit per search.')
+    parser.add_argument('--ef_search',default=None, type=int, help='HNSW efSearch.')
+    parser.add_argument('--sharded', action='store_true', help='Search the index shards listed in shard_manifest.json in parallel.')
+    parser.add_argument('--shard_workers',default=None, type=int, help='Number of threads searching shards, defaults to one per shard.')
+    parser.add_argument('--retrieval_mode',default='dense', type=str, choices=['dense', 'lexical', 'hybrid'], help='dense (faiss), lexical (BM25 on CPU) or hybrid (reciprocal rank fusion of both).')
+    parser.add_argument('--mmr_lambda',default=1.0, type=float, help='Relevance / diversity trade-off of maximal marginal relevance reranking of retrieved papers, 1 keeps the nearest neighbours as they are.')
+    parser.add_argument('--mmr_pool',default=3, type=int, help='With --mmr_lambda < 1, rerank num * mmr_pool retrieved candidates.')
+    parser.add_argument('--device',default='auto', type=str, choices=['auto', 'cuda', 'cpu'], help='Device for the embedding model, auto uses CUDA when available.')
+    parser.add_argument('--quantize',default='', type=str, choices=['', 'int8'], help='Quantize the embedding model (CPU only).')
+    parser.add_argument('--num_threads',default=0, type=int, help='Number of CPU threads for the embedding model, 0 keeps the torch default.')
+    parser.add_argument('--embedding_cache_path',default='', type=str, help='SQLite file for the on-disk query embedding cache, empty keeps the cache in memory only.')
+    parser.add_argument('--embedding_batch_window',default=5, type=float, help='Milliseconds a query embedding waits for concurrent queries to share its encoder batch, 0 encodes every call on its own.')
+    parser.add_argument('--embedding_max_batch',default=64, type=int, help='Largest encoder batch built from concurrent queries.')
+    parser.add_argument('--paper_content_path',default='./paper_content.h5', type=str, help='HDF5 file with the full content of the papers.')
+
+def database_from_args(args):
+    return database(db_path = args.db_path, embedding_model = args.embedding_model, metadata_backend = args.metadata_backend, faiss_mmap = args.faiss_mmap, index_variant = args.index_variant, nprobe = args.nprobe, ef_search = args.ef_search, paper_content_path = args.paper_content_path, device = args.device, quantize = args.quantize, num_threads = args.num_threads, embedding_cache_path = args.embedding_cache_path, sharded = args.sharded, shard_workers = args.shard_workers, retrieval_mode = args.retrieval_mode, mmr_lambda = args.mmr_lambda, mmr_pool = args.mmr_pool, embedding_batch_window = args.embedding_batch_window / 1000, embedding_max_batch = args.embedding_max_batch)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import shutil
+import itertools
+import numpy as np
+import faiss
+from src.embedding import load_embedding_model, embed_documents
+from src.metadata_store import create_sqlite_store, insert_records, SQLITE_FILE, TABLE_NAME
+from src.ann_index import FIELDS, flat_index_path
+from src.ingest import normalize_record, write_json_atomic, write_index_atomic
+from src.id_map import ID_MAP_FILE, IdMap
+
+BUILD_DIR = 'build'
+
+def iter_papers(path):
+    '''
+    JSONL sources are streamed line by line; JSON sources (a list or the arxiv_paper_db.json layout) have to be parsed whole.
+    '''
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(path, 'r') as f:
+        papers = json.loads(f.read())
+    if isinstance(papers, dict):
+        papers = papers.get(TABLE_NAME, papers).values()
+    yield from papers
+
+def shard_path(work_dir, shard, suffix):
+    return os.path.join(work_dir, f'shard_{shard:05d}.{suffix}')
+
+def save_npy_atomic(array, path):
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+def build_shards(source, db_path, embedding_model, device='auto', chunk_size=10000, batch_size=32):
+    '''
+    Stream the source in chunks of chunk_size papers and write the title/abstract embeddings of every chunk to .npy
+    shards under <db_path>/build. A shard counts as done once its .json file exists, so a restarted build skips
+    straight to the first unfinished shard.
+    '''
+    work_dir = os.path.join(db_path, BUILD_DIR)
+    os.makedirs(work_dir, exist_ok=True)
+    conn = create_sqlite_store(os.path.join(work_dir, SQLITE_FILE))
+    model = None
+    seen = set()
+    papers_iter = iter(iter_papers(source))
+    for shard in itertools.count():
+        chunk = list(itertools.islice(papers_iter, chunk_size))
+        if not chunk:
+            break
+        meta_path = shard_path(work_dir, shard, 'json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                seen.update(json.loads(f.read())['ids'])
+            continue
+
+        papers = []
+        for p in map(normalize_record, chunk):
+            if p['id'] not in seen:
+                seen.add(p['id'])
+                papers.append(p)
+
+        start = time.time()
+        if papers:
+            if model is None:
+                model = load_embedding_model(embedding_model, device=device)
+            for field in FIELDS:
+                vectors = embed_documents(model, [p[field] for p in papers], batch_size, sort_by_length=True)
+                save_npy_atomic(vectors, shard_path(work_dir, shard, f'{field}.npy'))
+            insert_records(conn, papers)
+            conn.commit()
+        seconds = time.time() - start
+        docs_per_sec = len(papers) / seconds if seconds > 0 else 0.0
+        write_json_atomic({'ids': [p['id'] for p in papers], 'seconds': seconds, 'docs_per_sec': docs_per_sec}, meta_path)
+        print(f'shard {shard}: {len(papers)} papers in {seconds:.1f}s, {docs_per_sec:.1f} docs/sec')
+    conn.close()
+    return work_dir
+
+def finalize_build(db_path):
+    '''
+    Assemble the finished shards into the flat faiss indexes, the id map and the SQLite metadata store.
+    '''
+    work_dir = os.path.join(db_path, BUILD_DIR)
+    shards = sorted(_ for _ in os.listdir(work_dir) if _.startswith('shard_') and _.endswith('.json'))
+    id_to_index = {}
+    indexes = {}
+    for name in shards:
+        shard = int(name[len('shard_'):-len('.json')])
+        with open(os.path.join(work_dir, name), 'r') as f:
+            ids = json.loads(f.read())['ids']
+        if not ids:
+            continue
+        for field in FIELDS:
+            vectors = np.load(shard_path(work_dir, shard, f'{field}.npy'))
+            if field not in indexes:
+                indexes[field] = faiss.IndexFlatL2(vectors.shape[1])
+            indexes[field].add(vectors)
+        for paper_id in ids:
+            id_to_index[paper_id] = len(id_to_index)
+    for field, index in indexes.items():
+        write_index_atomic(index, flat_index_path(db_path, field))
+    sqlite_path = os.path.join(db_path, SQLITE_FILE)
+    shutil.copyfile(os.path.join(work_dir, SQLITE_FILE), sqlite_path + '.tmp')
+    os.replace(sqlite_path + '.tmp', sqlite_path)
+    write_json_atomic(id_to_index, os.path.join(db_path, ID_MAP_FILE))
+    IdMap.build(db_path, id_to_index)
+    return len(id_to_index)
@@ -0,0 +1,91 @@
+import time
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+# fixed query set for comparing encoder variants, kept stable so numbers are comparable between runs
+BENCHMARK_QUERIES = [
+    'LLMs for education',
+    'In-context learning in large language models',
+    'Out-of-distribution detection for deep neural networks',
+    'Semi-supervised learning with consistency regularization',
+    'Retrieval-augmented generation for knowledge-intensive tasks',
+    'Graph neural networks for molecular property prediction',
+    'Vision transformers for image classification',
+    'Reinforcement learning from human feedback',
+    'Efficient attention mechanisms for long sequences',
+    'Federated learning under non-IID data',
+    'Adversarial robustness of image classifiers',
+    'Diffusion models for image synthesis',
+    'Automatic speech recognition with self-supervised pretraining',
+    'Neural architecture search',
+    'Knowledge distillation for model compression',
+    'Hallucination in large language models',
+    'Code generation with large language models',
+    'Multimodal large language models',
+    'Continual learning and catastrophic forgetting',
+    'Explainable artificial intelligence methods',
+    'Contrastive representation learning',
+    'Mixture of experts for scaling language models',
+    'Parameter-efficient fine-tuning',
+    'Evaluation benchmarks for large language models',
+    'Autonomous agents built on large language models',
+    'Recommender systems with deep learning',
+    'Time series forecasting with transformers',
+    'Privacy-preserving machine learning',
+    'Causal inference in machine learning',
+    'Quantization of neural networks for inference',
+    'Literature review automation with language models',
+    'Text-to-SQL semantic parsing',
+]
+
+def resolve_device(device='auto'):
+    if device == 'auto':
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    return device
+
+def load_embedding_model(embedding_model, device='auto', quantize=None, num_threads=None):
+    '''
+    Load the SentenceTransformer encoder. quantize='int8' applies dynamic int8 quantization to every Linear layer,
+    which only runs on CPU.
+    '''
+    device = resolve_device(device)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = SentenceTransformer(embedding_model, trust_remote_code=True, device=device)
+    if quantize == 'int8':
+        if device != 'cpu':
+            raise ValueError('int8 quantization of the embedding model is only supported on CPU')
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif quantize:
+        raise ValueError(f'Unknown quantization mode: {quantize}')
+    model.eval()
+    return model
+
+def embed_documents(model, texts, batch_size=32, sort_by_length=False):
+    order = np.arange(len(texts))
+    if sort_by_length:
+        # batches of similar token length waste little compute on padding
+        lengths = [len(_) for _ in model.tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+        order = np.argsort(lengths, kind='stable')
+    res = []
+    for i in range(0, len(texts), batch_size):
+        batch_text = ['search_document: ' + texts[j] for j in order[i:i+batch_size]]
+        res.append(model.encode(batch_text, batch_size=batch_size))
+    embeddings = np.concatenate(res, axis=0).astype('float32')
+    result = np.empty_like(embeddings)
+    result[order] = embeddings
+    return result
+
+def benchmark_encoder(model, texts, batch_size=32, repeat=3):
+    model.encode(texts[:batch_size], batch_size=batch_size)
+    start = time.time()
+    for _ in range(repeat):
+        embeddings = model.encode(texts, batch_size=batch_size)
+    elapsed = time.time() - start
+    return np.asarray(embeddings, dtype='float32'), len(texts) * repeat / elapsed
+
+def cosine_similarity_rows(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
@@ -0,0 +1,81 @@
+import time
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+class EmbeddingBatcher():
+    '''
+    Coalesces encode calls from concurrent threads into shared encoder batches. The first request of a batch waits at
+    most max_wait seconds for others to join, and a batch is closed early once it holds max_batch_size texts; requests
+    arriving while a batch is encoding go into the next one. Duplicate texts within a batch are encoded once.
+    '''
+
+    def __init__(self, encode_fn, max_wait=0.005, max_batch_size=64) -> None:
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._cond = threading.Condition()
+        self._worker = None
+        self.num_batches, self.num_requests, self.num_texts, self.largest_batch = 0, 0, 0, 0
+        self.total_delay, self.max_delay = 0.0, 0.0
+
+    def encode(self, texts):
+        texts = list(texts)
+        if not texts:
+            return self.encode_fn(texts)
+        future = Future()
+        with self._cond:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._pending.append((texts, future, time.perf_counter()))
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while sum(len(_[0]) for _ in self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+                batch.append(self._pending.pop(0))
+                size += len(batch[-1][0])
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            unique = list(dict.fromkeys(t for texts, _, _ in batch for t in texts))
+            try:
+                vectors = np.asarray(self.encode_fn(unique))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            rows = {t: i for i, t in enumerate(unique)}
+            with self._cond:
+                self.num_batches += 1
+                self.num_requests += len(batch)
+                self.num_texts += len(unique)
+                self.largest_batch = max(self.largest_batch, len(unique))
+                for _, _, enqueued in batch:
+                    self.total_delay += start - enqueued
+                    self.max_delay = max(self.max_delay, start - enqueued)
+            for texts, future, _ in batch:
+                future.set_result(vectors[[rows[t] for t in texts]])
+
+    def stats(self):
+        with self._cond:
+            return {'batches': self.num_batches, 'requests': self.num_requests,
+                    'mean_batch_size': self.num_texts / self.num_batches if self.num_batches else 0.0,
+                    'largest_batch': self.largest_batch,
+                    'mean_queue_delay_ms': 1000 * self.total_delay / self.num_requests if self.num_requests else 0.0,
+                    'max_queue_delay_ms': 1000 * self.max_delay}
@@ -0,0 +1,84 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SQLITE_MAX_VARS = 900
+
+class EmbeddingCache():
+    '''
+    Content-addressed cache of encoder outputs, keyed on the model name and the full (already prefixed) text.
+    Lookups go through an in-process LRU first and an optional SQLite file second; only the texts missing from both
+    are sent to the encoder, in a single batch.
+    '''
+
+    def __init__(self, model_name, cache_path=None, max_memory_items=50000) -> None:
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+            self._conn.commit()
+        self.memory_hits, self.disk_hits, self.misses = 0, 0, 0
+
+    def key(self, text):
+        return hashlib.sha256(f'{self.model_name}\x00{text}'.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    found[k] = self._memory[k]
+            self.memory_hits += len(found)
+            pending = [k for k in keys if k not in found]
+            if self._conn is not None and pending:
+                for start in range(0, len(pending), SQLITE_MAX_VARS):
+                    chunk = pending[start:start + SQLITE_MAX_VARS]
+                    placeholders = ','.join('?' * len(chunk))
+                    for k, blob in self._conn.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', chunk):
+                        vector = np.frombuffer(blob, dtype='float32')
+                        found[k] = vector
+                        self._remember(k, vector)
+                        self.disk_hits += 1
+        return found
+
+    def _store(self, keys, vectors):
+        with self._lock:
+            for k, v in zip(keys, vectors):
+                self._remember(k, v)
+            if self._conn is not None:
+                self._conn.executemany('INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)', [(k, v.tobytes()) for k, v in zip(keys, vectors)])
+                self._conn.commit()
+
+    def get_or_compute(self, texts, encode_fn):
+        if len(texts) == 0:
+            return encode_fn(texts)
+        keys = [self.key(t) for t in texts]
+        unique = dict(zip(keys, texts))
+        found = self._lookup(list(unique.keys()))
+        missing = [k for k in unique if k not in found]
+        if missing:
+            vectors = np.asarray(encode_fn([unique[k] for k in missing]), dtype='float32')
+            with self._lock:
+                self.misses += len(missing)
+            self._store(missing, vectors)
+            found.update(zip(missing, vectors))
+        return np.stack([found[k] for k in keys])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0}
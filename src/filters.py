@@ -0,0 +1,149 @@
+import re
+import threading
+import numpy as np
+import faiss
+from src.ann_index import enable_reconstruct, reconstruct_rows
+
+CATEGORY_FIELDS = ['categories', 'category', 'cat']
+# filters with at most this many eligible rows are searched exactly over the reconstructed vectors
+EXACT_SEARCH_ROWS = 4096
+
+_reconstruct_lock = threading.Lock()
+
+def record_categories(record):
+    for field in CATEGORY_FIELDS:
+        value = record.get(field)
+        if value:
+            return value if isinstance(value, list) else re.split(r'[\s,;]+', value.strip())
+    return []
+
+class RowAttributes():
+    '''
+    Per-row filter attributes, precomputed in one pass over the metadata: rows sorted by date, so a date range is two
+    binary searches, and an inverted list of rows per category.
+    '''
+
+    def __init__(self, records, id_map, num_rows) -> None:
+        dates = [''] * num_rows
+        categories = {}
+        for row, r in id_map.iter_rows(records):
+            dates[row] = str(r.get('date') or '')
+            for c in record_categories(r):
+                categories.setdefault(c, []).append(row)
+        dates = np.array(dates, dtype=str)
+        self.num_rows = num_rows
+        self.date_order = np.argsort(dates, kind='stable')
+        self.sorted_dates = dates[self.date_order]
+        self.num_undated = int(np.searchsorted(self.sorted_dates, '', side='right'))
+        self.categories = {c: np.unique(np.array(rows, dtype='int64')) for c, rows in categories.items()}
+
+    def rows_in_date_range(self, date_from=None, date_to=None):
+        # papers without a date never match a date filter; date_to is inclusive on prefixes, '2023' covers '2023-12-31'
+        lo = max(self.num_undated, int(np.searchsorted(self.sorted_dates, date_from, side='left')) if date_from else 0)
+        hi = int(np.searchsorted(self.sorted_dates, date_to + '\uffff', side='right')) if date_to else self.num_rows
+        return np.sort(self.date_order[lo:hi]).astype('int64')
+
+    def rows_in_categories(self, categories):
+        rows = [self.categories[c] for c in categories if c in self.categories]
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype='int64')
+
+def compile_filters(filters, attributes, id_map):
+    '''
+    Turn {'date_from', 'date_to', 'ids', 'categories'} into the sorted array of eligible faiss rows.
+    '''
+    rows = None
+    if filters.get('date_from') or filters.get('date_to'):
+        rows = attributes.rows_in_date_range(filters.get('date_from'), filters.get('date_to'))
+    if filters.get('categories'):
+        cat_rows = attributes.rows_in_categories(filters['categories'])
+        rows = cat_rows if rows is None else np.intersect1d(rows, cat_rows, assume_unique=True)
+    if filters.get('ids') is not None:
+        id_rows = np.unique(id_map.rows(list(filters['ids'])))
+        id_rows = id_rows[id_rows >= 0]
+        rows = id_rows if rows is None else np.intersect1d(rows, id_rows, assume_unique=True)
+    return rows
+
+def make_selector(rows, ntotal):
+    '''
+    Returns the selector and the array backing it, which has to stay alive while faiss searches.
+    '''
+    rows = np.ascontiguousarray(rows, dtype='int64')
+    if len(rows) * 8 > ntotal:
+        # broad filters: one bit per row is smaller and faster to test than a hash set of the ids
+        mask = np.zeros(ntotal, dtype=bool)
+        mask[rows] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        return faiss.IDSelectorBitmap(ntotal, faiss.swig_ptr(bitmap)), bitmap
+    return faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(rows)), rows
+
+def search_parameters(index, selector, scale=1):
+    # explicit parameters replace the index defaults, so carry over the configured nprobe / efSearch, widened by scale
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, ivf.nprobe * scale))
+    downcast = faiss.downcast_index(index)
+    if isinstance(downcast, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(max(index.ntotal, 1), downcast.hnsw.efSearch * scale))
+    return faiss.SearchParameters(sel=selector)
+
+def can_widen(index, scale):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return ivf.nprobe * scale < ivf.nlist
+    downcast = faiss.downcast_index(index)
+    if isinstance(downcast, faiss.IndexHNSW):
+        return downcast.hnsw.efSearch * scale < index.ntotal
+    return False
+
+def exact_subset_search(index, x, k, rows):
+    '''
+    Exact search over the reconstructed vectors of the eligible rows; approximate variants return their decoded vectors.
+    '''
+    with _reconstruct_lock:
+        enable_reconstruct(index)
+    subset = faiss.IndexFlat(index.d, index.metric_type)
+    subset.add(np.ascontiguousarray(reconstruct_rows(index, rows), dtype='float32'))
+    distances, found = subset.search(x, k)
+    return distances, np.where(found >= 0, rows[np.maximum(found, 0)], -1)
+
+def postfiltered_search(index, x, k, rows, factor=8):
+    '''
+    For faiss < 1.7.3, which has no search-time selectors: over-fetch k * factor neighbours, drop the ineligible rows
+    and fetch factor times more until every query has k eligible hits or the whole index has been searched.
+    '''
+    distances = np.full((len(x), k), np.inf, dtype='float32')
+    indices = np.full((len(x), k), -1, dtype='int64')
+    fetch = min(index.ntotal, k * factor)
+    while fetch > 0:
+        D, I = index.search(x, fetch)
+        keep = (I >= 0) & np.isin(I, rows)
+        if fetch >= index.ntotal or (keep.sum(axis=1) >= k).all():
+            break
+        fetch = min(index.ntotal, fetch * factor)
+    else:
+        return distances, indices
+    for q in range(len(x)):
+        hits = np.flatnonzero(keep[q])[:k]
+        distances[q, :len(hits)], indices[q, :len(hits)] = D[q, hits], I[q, hits]
+    return distances, indices
+
+def filtered_search(index, x, k, rows, factor=8, exact_rows=EXACT_SEARCH_ROWS):
+    '''
+    Search only the given rows: ineligible vectors are skipped inside faiss, so the top-k is filled from eligible rows.
+    IVF and HNSW indexes only look at the probed lists or visited nodes, so narrow filters are searched exactly and
+    nprobe / efSearch are widened by factor until every query has min(k, len(rows)) hits.
+    '''
+    rows = np.asarray(rows, dtype='int64')
+    if len(rows) == 0:
+        return np.full((len(x), k), np.inf, dtype='float32'), np.full((len(x), k), -1, dtype='int64')
+    if len(rows) <= exact_rows:
+        return exact_subset_search(index, x, k, rows)
+    if not hasattr(faiss, 'SearchParameters'):
+        return postfiltered_search(index, x, k, rows)
+    selector, backing = make_selector(rows, index.ntotal)
+    scale = 1
+    while True:
+        distances, indices = index.search(x, k, params=search_parameters(index, selector, scale))
+        if (indices >= 0).sum(axis=1).min() >= min(k, len(rows)) or not can_widen(index, scale):
+            return distances, indices
+        scale *= factor
@@ -0,0 +1,116 @@
+import os
+import json
+from itertools import islice
+import numpy as np
+
+ID_MAP_FILE = 'arxivid_to_index_abs.json'
+ID_MAP_DIR = 'id_map'
+
+def read_id_map_json(db_path):
+    with open(os.path.join(db_path, ID_MAP_FILE), 'r') as f:
+        return {id: int(index) for id, index in json.loads(f.read()).items()}
+
+def json_signature(db_path):
+    stat = os.stat(os.path.join(db_path, ID_MAP_FILE))
+    return [stat.st_size, stat.st_mtime_ns]
+
+def save_npy_atomic(array, path):
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(path + '.tmp', path)
+
+class IdMap():
+    '''
+    Row <-> paper id mapping kept in numpy arrays instead of two Python dicts: ids holds the fixed-width id of every
+    faiss row (empty for unused rows), and sorted_ids / sorted_rows answer id -> row with a binary search.
+    The arrays are saved under id_map/ and memory-mapped on load. arxivid_to_index_abs.json stays the source of truth;
+    the arrays are rebuilt from it whenever it changes.
+    '''
+
+    def __init__(self, ids, sorted_ids, sorted_rows) -> None:
+        self.ids_array = ids
+        self.sorted_ids = sorted_ids
+        self.sorted_rows = sorted_rows
+
+    @classmethod
+    def from_dict(cls, id_to_index):
+        num_rows = max(id_to_index.values()) + 1 if id_to_index else 0
+        encoded = {id.encode('utf-8'): row for id, row in id_to_index.items()}
+        width = max(map(len, encoded), default=1)
+        ids = np.zeros(num_rows, dtype=f'S{width}')
+        ids[np.fromiter(encoded.values(), dtype='int64', count=len(encoded))] = list(encoded)
+        order = np.argsort(ids, kind='stable')
+        order = order[ids[order] != b'']
+        return cls(ids, ids[order], order.astype('int64'))
+
+    @classmethod
+    def build(cls, db_path, id_to_index=None):
+        signature = json_signature(db_path)
+        id_map = cls.from_dict(read_id_map_json(db_path) if id_to_index is None else id_to_index)
+        path = os.path.join(db_path, ID_MAP_DIR)
+        try:
+            os.makedirs(path, exist_ok=True)
+            save_npy_atomic(id_map.ids_array, os.path.join(path, 'ids.npy'))
+            save_npy_atomic(id_map.sorted_ids, os.path.join(path, 'sorted_ids.npy'))
+            save_npy_atomic(id_map.sorted_rows, os.path.join(path, 'sorted_rows.npy'))
+            with open(os.path.join(path, 'signature.json.tmp'), 'w') as f:
+                json.dump(signature, f)
+            os.replace(os.path.join(path, 'signature.json.tmp'), os.path.join(path, 'signature.json'))
+        except OSError as e:
+            print(f'Warning: could not save the id map to {path}: {e}')
+        return id_map
+
+    @classmethod
+    def load(cls, db_path):
+        path = os.path.join(db_path, ID_MAP_DIR)
+        if os.path.exists(os.path.join(path, 'signature.json')):
+            with open(os.path.join(path, 'signature.json'), 'r') as f:
+                saved = json.loads(f.read())
+            if saved == json_signature(db_path):
+                arrays = [np.load(os.path.join(path, name), mmap_mode='r') for name in ['ids.npy', 'sorted_ids.npy', 'sorted_rows.npy']]
+                return cls(*arrays)
+        return cls.build(db_path)
+
+    def __len__(self):
+        return len(self.ids_array)
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def rows(self, ids):
+        '''
+        Rows of the given paper ids, -1 for ids that are not in the database.
+        '''
+        if len(self.sorted_ids) == 0:
+            return np.full(len(ids), -1, dtype='int64')
+        width = self.sorted_ids.dtype.itemsize
+        encoded = [_.encode('utf-8') for _ in ids]
+        keys = np.array(encoded, dtype=self.sorted_ids.dtype)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, keys), len(self.sorted_ids) - 1)
+        # ids longer than the stored width would be truncated by numpy and could collide with a shorter id
+        found = (self.sorted_ids[pos] == keys) & np.array([len(_) <= width for _ in encoded], dtype=bool)
+        return np.where(found, self.sorted_rows[pos], -1).astype('int64')
+
+    def iter_rows(self, records, chunk_size=100000):
+        '''
+        (row, record) for every record whose id is in the database, looked up with one rows() call per chunk instead
+        of a binary search per record.
+        '''
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return
+            for row, r in zip(self.rows([r['id'] for r in chunk]).tolist(), chunk):
+                if row != -1:
+                    yield row, r
+
+    def get(self, id, default=None):
+        row = int(self.rows([id])[0])
+        return default if row == -1 else row
+
+    def ids(self, rows):
+        return [_.decode('utf-8') for _ in self.ids_array[np.asarray(rows, dtype='int64')]]
+
+    def id(self, row):
+        return self.ids_array[row].decode('utf-8')
@@ -0,0 +1,101 @@
+import os
+import json
+import faiss
+from src.embedding import load_embedding_model, embed_documents
+from src.metadata_store import add_records, TABLE_NAME
+from src.ann_index import FIELDS, flat_index_path, load_manifest, save_manifest
+from src.sharded_index import SHARD_MANIFEST_FILE, load_shard_manifest, save_shard_manifest
+from src.id_map import ID_MAP_FILE, IdMap, read_id_map_json
+from src.vector_store import extend_vector_store
+
+def load_papers(path):
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            return [json.loads(l) for l in f if l.strip()]
+    with open(path, 'r') as f:
+        papers = json.loads(f.read())
+    if isinstance(papers, dict):
+        papers = list(papers.get(TABLE_NAME, papers).values())
+    return papers
+
+def normalize_record(record):
+    record = dict(record)
+    if 'abs' not in record and 'abstract' in record:
+        record['abs'] = record.pop('abstract')
+    return record
+
+def write_json_atomic(obj, path):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(obj, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def write_index_atomic(index, path):
+    faiss.write_index(index, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def extend_index(path, vectors, committed):
+    index = faiss.read_index(path)
+    if index.ntotal > committed:
+        # rows appended by an ingest that was interrupted before its id map was written
+        index.remove_ids(faiss.IDSelectorRange(committed, index.ntotal))
+    if index.ntotal != committed:
+        raise ValueError(f'{path} holds {index.ntotal} vectors but the id map covers {committed} rows')
+    index.add(vectors)
+    write_index_atomic(index, path)
+    return index.ntotal
+
+def extend_last_shard(db_path, field, vectors, committed):
+    manifest = load_shard_manifest(db_path)
+    shards = manifest['fields'][field]
+    # rows before the last shard are fixed, new rows always go to the end
+    preceding = sum(_['ntotal'] for _ in shards[:-1])
+    shards[-1]['ntotal'] = extend_index(os.path.join(db_path, shards[-1]['path']), vectors, committed - preceding)
+    save_shard_manifest(db_path, manifest)
+
+def ingest_papers(db_path, papers, embedding_model, device='auto', batch_size=32):
+    '''
+    Append papers that are not in the database yet. Only the new titles and abstracts are embedded; they are added to
+    the flat indexes and to every approximate variant in ann_manifest.json, then the metadata and the id map are
+    extended. The last index shard and the compact vector stores are extended as well when they exist.
+    The id map is written last, so an interrupted ingest is rolled forward by simply running it again.
+    '''
+    id_map_path = os.path.join(db_path, ID_MAP_FILE)
+    id_to_index = read_id_map_json(db_path)
+    committed = max(id_to_index.values()) + 1 if id_to_index else 0
+
+    new_papers = {}
+    for p in map(normalize_record, papers):
+        if p['id'] not in id_to_index and p['id'] not in new_papers:
+            new_papers[p['id']] = p
+    new_papers = list(new_papers.values())
+    if not new_papers:
+        return 0
+
+    model = load_embedding_model(embedding_model, device=device)
+    vectors = {'title': embed_documents(model, [p['title'] for p in new_papers], batch_size),
+               'abs': embed_documents(model, [p['abs'] for p in new_papers], batch_size)}
+
+    manifest = load_manifest(db_path)
+    for field in FIELDS:
+        extend_index(flat_index_path(db_path, field), vectors[field], committed)
+        if os.path.exists(os.path.join(db_path, SHARD_MANIFEST_FILE)):
+            extend_last_shard(db_path, field, vectors[field], committed)
+        for name, entry in manifest['variants'].items():
+            if field not in entry['files']:
+                continue
+            try:
+                entry['build'][field]['ntotal'] = extend_index(os.path.join(db_path, entry['files'][field]), vectors[field], committed)
+            except (RuntimeError, ValueError) as e:
+                print(f'Warning: variant {name} ({field}) was not extended and needs `db_tools.py build-ann`: {e}')
+        try:
+            extend_vector_store(db_path, field, vectors[field], committed)
+        except ValueError as e:
+            print(f'Warning: the {field} vector store was not extended and needs `db_tools.py build-vectors`: {e}')
+    save_manifest(db_path, manifest)
+
+    add_records(db_path, new_papers)
+    for i, p in enumerate(new_papers):
+        id_to_index[p['id']] = committed + i
+    write_json_atomic(id_to_index, id_map_path)
+    IdMap.build(db_path, id_to_index)
+    return len(new_papers)
@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import math
+from array import array
+import numpy as np
+
+BM25_DIR = 'bm25'
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOPWORDS = set('a an and are as at be by for from has have in is it its of on or that the this to was were which with we our via using based'.split())
+
+def tokenize(text):
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc: -scores[doc])[:top_k]
+
+class BM25Index():
+    '''
+    Inverted index over title + abstract, keyed on the faiss row of each paper so lexical and dense rankings can be fused
+    directly. Postings are stored term-major in flat numpy arrays (CSR layout) and scored with vectorized numpy.
+    '''
+
+    def __init__(self, vocab, indptr, post_rows, post_tfs, doc_len, k1=1.2, b=0.75) -> None:
+        self.vocab = vocab
+        self.indptr, self.post_rows, self.post_tfs, self.doc_len = indptr, post_rows, post_tfs, doc_len
+        self.k1, self.b = k1, b
+        self.num_docs = int((doc_len > 0).sum())
+        self.avg_len = float(doc_len.sum() / max(self.num_docs, 1))
+
+    @classmethod
+    def build(cls, records, id_map, num_rows):
+        vocab = {}
+        doc_rows, term_ids, tfs = array('i'), array('i'), array('i')
+        doc_len = np.zeros(num_rows, dtype='float32')
+        for row, r in id_map.iter_rows(records):
+            counts = {}
+            tokens = tokenize(f"{r['title']} {r['abs']}")
+            for t in tokens:
+                tid = vocab.setdefault(t, len(vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            doc_len[row] = len(tokens)
+            doc_rows.extend([row] * len(counts))
+            term_ids.extend(counts.keys())
+            tfs.extend(counts.values())
+        term_ids = np.frombuffer(term_ids, dtype='int32')
+        order = np.argsort(term_ids, kind='stable')
+        indptr = np.zeros(len(vocab) + 1, dtype='int64')
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+        post_rows = np.frombuffer(doc_rows, dtype='int32')[order]
+        post_tfs = np.frombuffer(tfs, dtype='int32')[order].astype('float32')
+        return cls(vocab, indptr, post_rows, post_tfs, doc_len)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, 'postings.npz'), indptr=self.indptr, post_rows=self.post_rows, post_tfs=self.post_tfs, doc_len=self.doc_len)
+        with open(os.path.join(path, 'vocab.json'), 'w') as f:
+            json.dump(self.vocab, f)
+
+    @classmethod
+    def load(cls, path):
+        arrays = np.load(os.path.join(path, 'postings.npz'))
+        with open(os.path.join(path, 'vocab.json'), 'r') as f:
+            vocab = json.loads(f.read())
+        return cls(vocab, arrays['indptr'], arrays['post_rows'], arrays['post_tfs'], arrays['doc_len'])
+
+    def search(self, query, top_k, rows=None):
+        scores = np.zeros(len(self.doc_len), dtype='float32')
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(len(self.doc_len), dtype=bool)
+            allowed[rows] = True
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.avg_len)
+        for t in set(tokenize(query)):
+            tid = self.vocab.get(t)
+            if tid is None:
+                continue
+            start, end = self.indptr[tid], self.indptr[tid + 1]
+            doc_rows, tf = self.post_rows[start:end], self.post_tfs[start:end]
+            idf = math.log(1 + (self.num_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[doc_rows] += idf * tf * (self.k1 + 1) / (tf + norm[doc_rows])
+        if allowed is not None:
+            scores[~allowed] = 0
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [int(_) for _ in candidates if scores[_] > 0]
@@ -0,0 +1,147 @@
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from tqdm import tqdm
+
+TINYDB_FILE = 'arxiv_paper_db.json'
+SQLITE_FILE = 'arxiv_paper_db.sqlite'
+TABLE_NAME = 'cs_paper_info'
+
+# SQLite refuses statements with more than 999 bound parameters on older builds
+SQLITE_MAX_VARS = 900
+
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+class TinyDBMetadataStore():
+    '''
+    The original JSON backend. Every lookup is a scan of the whole table, kept for databases that have not been converted yet.
+    '''
+
+    def __init__(self, json_path, table_name=TABLE_NAME) -> None:
+        from tinydb import TinyDB, Query
+        self.db = TinyDB(json_path)
+        self.table = self.db.table(table_name)
+        self.User = Query()
+
+    def get(self, ids):
+        ids = _unique(ids)
+        by_id = {r['id']: r for r in self.table.search(self.User.id.one_of(ids))}
+        return [by_id[_] for _ in ids if _ in by_id]
+
+    def iter_records(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+class SQLiteMetadataStore():
+    '''
+    Paper metadata keyed on the arXiv id (primary key), so a lookup of k ids costs k index probes instead of a table scan.
+    Connections are opened read-only and kept per thread because the agents query the database from many threads.
+    '''
+
+    def __init__(self, sqlite_path) -> None:
+        if not os.path.exists(sqlite_path):
+            raise FileNotFoundError(f'Metadata store not found: {sqlite_path}, convert it with `python db_tools.py convert-metadata`')
+        self.sqlite_path = sqlite_path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = Path(self.sqlite_path).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def get(self, ids):
+        ids = _unique(ids)
+        by_id = {}
+        conn = self._conn()
+        for start in range(0, len(ids), SQLITE_MAX_VARS):
+            chunk = ids[start:start + SQLITE_MAX_VARS]
+            placeholders = ','.join('?' * len(chunk))
+            for paper_id, doc in conn.execute(f'SELECT id, doc FROM papers WHERE id IN ({placeholders})', chunk):
+                by_id[paper_id] = json.loads(doc)
+        return [by_id[_] for _ in ids if _ in by_id]
+
+    def iter_records(self):
+        for (doc,) in self._conn().execute('SELECT doc FROM papers ORDER BY rowid'):
+            yield json.loads(doc)
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM papers').fetchone()[0]
+
+def create_sqlite_store(sqlite_path):
+    conn = sqlite3.connect(sqlite_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS papers (id TEXT PRIMARY KEY, date TEXT, doc TEXT NOT NULL)')
+    return conn
+
+def insert_records(conn, records):
+    rows = [(r['id'], r.get('date'), json.dumps(r, ensure_ascii=False)) for r in records]
+    conn.executemany('INSERT OR REPLACE INTO papers (id, date, doc) VALUES (?, ?, ?)', rows)
+
+def convert_tinydb_to_sqlite(json_path, sqlite_path, table_name=TABLE_NAME, batch_size=10000):
+    '''
+    One-shot conversion of arxiv_paper_db.json into the SQLite store. The file is written next to the target and moved
+    into place at the end, so an interrupted conversion never leaves a half-filled store behind.
+    '''
+    with open(json_path, 'r') as f:
+        table = json.loads(f.read())[table_name]
+
+    tmp_path = sqlite_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = create_sqlite_store(tmp_path)
+    records = list(table.values())
+    for start in tqdm(range(0, len(records), batch_size)):
+        insert_records(conn, records[start:start + batch_size])
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, sqlite_path)
+    return len(records)
+
+def add_tinydb_records(json_path, records):
+    '''
+    The TinyDB file is rewritten once through a temporary copy moved into place, so a crash leaves the old file intact;
+    records whose id is already there (left by an interrupted ingest) are skipped.
+    '''
+    from tinydb import TinyDB
+    tmp_path = json_path + '.tmp'
+    if os.path.exists(json_path):
+        shutil.copyfile(json_path, tmp_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = TinyDB(tmp_path)
+    table = db.table(TABLE_NAME)
+    existing = {r['id'] for r in table}
+    table.insert_multiple([r for r in records if r['id'] not in existing])
+    db.close()
+    os.replace(tmp_path, json_path)
+
+def add_records(db_path, records):
+    '''
+    Add new records to every metadata store of the database: the SQLite store when it exists, and the TinyDB file when
+    it exists or there is no SQLite store, so switching --metadata_backend never reads a stale store.
+    '''
+    sqlite_path = os.path.join(db_path, SQLITE_FILE)
+    json_path = os.path.join(db_path, TINYDB_FILE)
+    if os.path.exists(sqlite_path):
+        conn = sqlite3.connect(sqlite_path)
+        insert_records(conn, records)
+        conn.commit()
+        conn.close()
+    if os.path.exists(json_path) or not os.path.exists(sqlite_path):
+        add_tinydb_records(json_path, records)
+
+def open_metadata_store(db_path, backend='auto'):
+    sqlite_path = os.path.join(db_path, SQLITE_FILE)
+    if backend == 'sqlite' or (backend == 'auto' and os.path.exists(sqlite_path)):
+        return SQLiteMetadataStore(sqlite_path)
+    if backend in ('tinydb', 'auto'):
+        return TinyDBMetadataStore(os.path.join(db_path, TINYDB_FILE))
+    raise ValueError(f'Unknown metadata backend: {backend}')
@@ -0,0 +1,27 @@
+import numpy as np
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def mmr_select(query, candidates, top_k, mmr_lambda=0.5):
+    '''
+    Maximal marginal relevance: greedily pick the candidate maximizing
+    mmr_lambda * sim(query, c) - (1 - mmr_lambda) * max(sim(c, picked)), with cosine similarities.
+    Each step is one matrix-vector product over the remaining pool. Returns indices into candidates, in pick order.
+    '''
+    candidates = normalize_rows(candidates)
+    relevance = candidates @ normalize_rows(query)
+    top_k = min(top_k, len(candidates))
+    redundancy = np.full(len(candidates), -np.inf, dtype='float32')
+    available = np.ones(len(candidates), dtype=bool)
+    picked = []
+    for _ in range(top_k):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * np.where(np.isinf(redundancy), 0, redundancy)
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+    return picked
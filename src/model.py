@@ -1,71 +1,363 @@
 import time
-import requests
 import json
-from tqdm import tqdm
+import atexit
+import queue
+import asyncio
 import threading
+import httpx
+from src.scheduler import RequestScheduler, PRIORITY_NORMAL
+from src.rate_limiter import RateLimiter, estimate_tokens
+from src.response_cache import ResponseCache
+from src.batch_api import run_batch
+from src.coalescer import RequestCoalescer
+
+_loop = None
+_loop_lock = threading.Lock()
+_scheduler = RequestScheduler()
+_rate_limiter = RateLimiter()
+_response_cache = None
+_coalescer = RequestCoalescer()
+
+# only these are worth retrying, other 4xx responses fail the same way every time
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def background_loop():
+    '''
+    One asyncio event loop per process, running in a daemon thread. All APIModel requests run on it, so synchronous
+    callers in any thread share the same connection pools instead of opening a connection per call.
+    '''
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='api-model-loop', daemon=True).start()
+    return _loop
+
+def run_sync(coro):
+    # blocks the calling thread, so it must not be called from the background loop itself
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
+
+def get_scheduler():
+    return _scheduler
+
+def configure_scheduler(max_in_flight):
+    '''
+    Set the number of LLM requests in flight at once across all APIModels of the process.
+    '''
+    background_loop().call_soon_threadsafe(_scheduler.set_max_in_flight, max_in_flight)
+
+def get_rate_limiter():
+    return _rate_limiter
+
+def configure_rate_limits(rpm=None, tpm=None):
+    '''
+    Requests / tokens per minute allowed by the API quota; limits left unset are read from the response headers.
+    '''
+    background_loop().call_soon_threadsafe(_rate_limiter.configure, rpm, tpm)
+
+def get_response_cache():
+    return _response_cache
+
+def configure_response_cache(path, max_bytes=1 << 30, cache_nondeterministic=False):
+    '''
+    Serve repeated prompts from an on-disk cache; only temperature 0 calls unless cache_nondeterministic is set.
+    '''
+    global _response_cache
+    _response_cache = ResponseCache(path, max_bytes=max_bytes, cache_nondeterministic=cache_nondeterministic) if path else None
+    if _response_cache is not None:
+        # keep the access times of the last hits for the next run's eviction order
+        atexit.register(_response_cache.flush)
+    return _response_cache
+
+def get_coalescer():
+    return _coalescer
+
+def coalescable(temperature):
+    # identical temperature > 0 prompts are usually meant to give independent samples
+    return temperature == 0 or (_response_cache is not None and _response_cache.cache_nondeterministic)
+
+async def on_background_loop(coro):
+    '''
+    Await a coroutine on the background loop from any event loop; the pooled clients are bound to that loop.
+    '''
+    loop = background_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+async def pump(agen, put):
+    # runs on the background loop and forwards ('item' | 'error' | 'done', value) to a consumer in another thread or loop
+    try:
+        async for item in agen:
+            put(('item', item))
+        put(('done', None))
+    except Exception as e:
+        put(('error', e))
+    finally:
+        await agen.aclose()
+
+async def iterate_on_background_loop(agen):
+    '''
+    Iterate an async generator that has to run on the background loop, from any event loop.
+    '''
+    loop = background_loop()
+    if asyncio.get_running_loop() is loop:
+        async for item in agen:
+            yield item
+        return
+    caller = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    future = asyncio.run_coroutine_threadsafe(pump(agen, lambda item: caller.call_soon_threadsafe(items.put_nowait, item)), loop)
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        future.cancel()
+
+def iterate_sync(agen):
+    items = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(pump(agen, items.put), background_loop())
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        future.cancel()
+
+async def iter_sse_deltas(response):
+    '''
+    Text deltas of an OpenAI-style server-sent event stream of chat completion chunks.
+    '''
+    async for line in response.aiter_lines():
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return
+        choices = json.loads(data).get('choices') or []
+        delta = (choices[0].get('delta') or {}).get('content') if choices else None
+        if delta:
+            yield delta
 
 class APIModel:
 
-    def __init__(self, model, api_key, api_url, organization_id=None) -> None:
+    def __init__(self, model, api_key, api_url, organization_id=None, max_connections=64, priority=PRIORITY_NORMAL, batch_api=False, batch_poll_interval=30, batch_dir=None) -> None:
         self.__api_key = api_key
         self.__api_url = api_url
         self.model = model
         self.__organization_id = organization_id
-        
-    def __req(self, text, temperature, max_try = 5):
-        url = f"{self.__api_url}"
-        pay_load_dict = {"model": f"{self.model}","messages": [{
-                "role": "user",
-                "temperature":temperature,
-                "content": f"{text}"}]}
-        payload = json.dumps(pay_load_dict)
+        self.__max_connections = max_connections
+        self.priority = priority
+        # batch_api sends batch_chat through the offline Batch API: cheaper and higher throughput, but minutes to hours
+        self.batch_api, self.batch_poll_interval, self.batch_dir = batch_api, batch_poll_interval, batch_dir
+        self.__client = None
+        self.__streams, self.__ttft_total, self.__ttft_max = 0, 0.0, 0.0
+
+    def __headers(self):
         headers = {
         'Accept': 'application/json',
         'Authorization': f'Bearer {self.__api_key}',
         'User-Agent': 'Apifox/1.0.0 (https://apifox.com)',
         'Content-Type': 'application/json'
         }
-        
+
         # 如果提供了organization_id，添加到headers中
         if self.__organization_id:
             headers['OpenAI-Organization'] = self.__organization_id
-        try:
-            response = requests.request("POST", url, headers=headers, data=payload)
-            return json.loads(response.text)['choices'][0]['message']['content']
-        except:
-            for _ in range(max_try):
-                try:
-                    response = requests.request("POST", url, headers=headers, data=payload)
-                    return json.loads(response.text)['choices'][0]['message']['content']
-                except:
-                    pass
-                time.sleep(0.2)
-            return None
-    
-    def chat(self, text, temperature=1):
-        response = self.__req(text, temperature=temperature, max_try=5)
-        return response
+        return headers
+
+    def __body(self, text, temperature):
+        return {"model": f"{self.model}","messages": [{
+                "role": "user",
+                "temperature":temperature,
+                "content": f"{text}"}]}
 
-    def __chat(self, text, temperature, res_l, idx):
-        
-        response = self.__req(text, temperature=temperature)
-        res_l[idx] = response
+    def __payload(self, text, temperature, stream=False):
+        pay_load_dict = self.__body(text, temperature)
+        if stream:
+            pay_load_dict["stream"] = True
+        return json.dumps(pay_load_dict)
+
+    def __get_client(self):
+        # created on the background loop at the first request, then reused with keep-alive for every later call
+        if self.__client is None:
+            self.__client = httpx.AsyncClient(timeout=httpx.Timeout(600, connect=30),
+                                              limits=httpx.Limits(max_connections=self.__max_connections, max_keepalive_connections=self.__max_connections))
+        return self.__client
+
+    async def __areq(self, text, temperature, max_try = 5, priority = None, use_cache = True):
+        # use_cache=False always calls the API, the fresh response still replaces the cached one
+        cache, key = _response_cache, None
+        if cache is not None and cache.cacheable(temperature):
+            key = cache.key(self.model, self.__api_url, temperature, text)
+            if use_cache:
+                response = await cache.aget(key)
+                if response is not None:
+                    return response
+        if use_cache and coalescable(temperature):
+            # an identical prompt already in flight is awaited instead of being sent again
+            return await _coalescer.run((self.model, self.__api_url, temperature, text), lambda: self.__request(text, temperature, max_try, priority, key))
+        return await self.__request(text, temperature, max_try, priority, key)
+
+    async def __request(self, text, temperature, max_try, priority, key):
+        # every request waits for a slot of the process-wide scheduler, retries included
+        response = await _scheduler.run(lambda: self.__send(text, temperature, max_try), self.priority if priority is None else priority)
+        if key is not None and response is not None:
+            await _response_cache.aput(key, response)
         return response
-        
-    def batch_chat(self, text_batch, temperature=0):
-        max_threads=15 # limit max concurrent threads using model API
-        res_l = ['No response'] * len(text_batch)
-        thread_l = []
-        for i, text in zip(range(len(text_batch)), text_batch):
-            thread = threading.Thread(target=self.__chat, args=(text, temperature, res_l, i))
-            thread_l.append(thread)
-            thread.start()
-            while len(thread_l) >= max_threads: 
-                for t in thread_l:
-                    if not t .is_alive():
-                        thread_l.remove(t)
-                time.sleep(0.3) # Short delay to avoid busy-waiting
-
-        for thread in tqdm(thread_l):
-            thread.join()
-        return res_l
+
+    async def __send(self, text, temperature, max_try):
+        client = self.__get_client()
+        payload = self.__payload(text, temperature)
+        headers = self.__headers()
+        tokens = estimate_tokens(text)
+        for attempt in range(max_try + 1):
+            await _rate_limiter.acquire(tokens)
+            try:
+                response = await client.post(self.__api_url, headers=headers, content=payload)
+            except httpx.HTTPError:
+                if attempt < max_try:
+                    await asyncio.sleep(_rate_limiter.backoff(attempt))
+                continue
+            _rate_limiter.update_from_headers(response.headers)
+            if response.status_code != 200:
+                if response.status_code not in RETRY_STATUS:
+                    print(f'API request failed with status {response.status_code}: {response.text[:200]}')
+                    return None
+                if attempt < max_try:
+                    await asyncio.sleep(_rate_limiter.backoff(attempt, response.headers, response.status_code))
+                continue
+            try:
+                body = json.loads(response.text)
+                content = body['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError):
+                if attempt < max_try:
+                    await asyncio.sleep(_rate_limiter.backoff(attempt))
+                continue
+            _rate_limiter.record_usage(tokens, body.get('usage'))
+            return content
+        return None
+
+    async def __astream(self, text, temperature, max_try, priority, use_cache, on_first_token):
+        cache, key = _response_cache, None
+        if cache is not None and cache.cacheable(temperature):
+            key = cache.key(self.model, self.__api_url, temperature, text)
+            cached = await cache.aget(key) if use_cache else None
+            if cached is not None:
+                yield cached
+                return
+        client = self.__get_client()
+        payload = self.__payload(text, temperature, stream=True)
+        headers = dict(self.__headers(), Accept='text/event-stream')
+        tokens = estimate_tokens(text)
+        parts = []
+        start = time.perf_counter()
+        # the slot is held until the last chunk has been read
+        async with _scheduler.slot(self.priority if priority is None else priority):
+            for attempt in range(max_try + 1):
+                delay = None
+                await _rate_limiter.acquire(tokens)
+                try:
+                    async with client.stream('POST', self.__api_url, headers=headers, content=payload) as response:
+                        _rate_limiter.update_from_headers(response.headers)
+                        if response.status_code == 200:
+                            async for delta in iter_sse_deltas(response):
+                                if not parts:
+                                    self.__record_ttft(time.perf_counter() - start, on_first_token)
+                                parts.append(delta)
+                                yield delta
+                            break
+                        body = (await response.aread()).decode('utf-8', errors='ignore')
+                        if response.status_code not in RETRY_STATUS:
+                            print(f'API request failed with status {response.status_code}: {body[:200]}')
+                            return
+                        delay = _rate_limiter.backoff(attempt, response.headers, response.status_code)
+                except (httpx.HTTPError, ValueError):
+                    # text already handed to the consumer cannot be taken back, so only retry before the first delta
+                    if parts:
+                        raise
+                    delay = _rate_limiter.backoff(attempt)
+                if attempt < max_try:
+                    await asyncio.sleep(delay)
+            else:
+                return
+        if key is not None:
+            await cache.aput(key, ''.join(parts))
+
+    def __record_ttft(self, ttft, on_first_token):
+        self.__streams += 1
+        self.__ttft_total += ttft
+        self.__ttft_max = max(self.__ttft_max, ttft)
+        if on_first_token is not None:
+            on_first_token(ttft)
+
+    def stream_stats(self):
+        return {'streams': self.__streams, 'mean_ttft_ms': 1000 * self.__ttft_total / self.__streams if self.__streams else 0.0,
+                'max_ttft_ms': 1000 * self.__ttft_max}
+
+    async def astream_chat(self, text, temperature=1, priority=None, use_cache=True, on_first_token=None):
+        '''
+        Yield the response text in chunks as the server streams it (server-sent events). on_first_token is called with
+        the time to first token in seconds. Yields nothing if the request fails.
+        '''
+        async for delta in iterate_on_background_loop(self.__astream(text, temperature, 5, priority, use_cache, on_first_token)):
+            yield delta
+
+    def stream_chat(self, text, temperature=1, priority=None, use_cache=True, on_first_token=None):
+        return iterate_sync(self.__astream(text, temperature, 5, priority, use_cache, on_first_token))
+
+    async def achat(self, text, temperature=1, priority=None, use_cache=True):
+        return await on_background_loop(self.__areq(text, temperature=temperature, max_try=5, priority=priority, use_cache=use_cache))
+
+    async def __abatch_offline(self, text_batch, temperature, use_cache):
+        results = [None] * len(text_batch)
+        cache, keys = _response_cache, [None] * len(text_batch)
+        if cache is not None and cache.cacheable(temperature):
+            keys = [cache.key(self.model, self.__api_url, temperature, text) for text in text_batch]
+            if use_cache:
+                results = await cache.aget_many(keys)
+        pending = [i for i, r in enumerate(results) if r is None]
+        if use_cache and coalescable(temperature):
+            # identical prompts are submitted once and share the response
+            unique = list(dict.fromkeys(text_batch[i] for i in pending))
+            _coalescer.count(len(pending), len(pending) - len(unique))
+        else:
+            unique = [text_batch[i] for i in pending]
+        if unique:
+            responses = await run_batch(self.__get_client(), self.__api_url, self.__headers(), [self.__body(text, temperature) for text in unique],
+                                        poll_interval=self.batch_poll_interval, batch_dir=self.batch_dir)
+            if len(unique) == len(pending):
+                by_position = responses
+            else:
+                by_text = dict(zip(unique, responses))
+                by_position = [by_text[text_batch[i]] for i in pending]
+            for i, response in zip(pending, by_position):
+                results[i] = response
+            fresh = [(keys[i], results[i]) for i in pending if keys[i] is not None and results[i] is not None]
+            if fresh:
+                await cache.aput_many(fresh)
+        return results
+
+    async def __abatch_chat(self, text_batch, temperature, priority, use_cache):
+        if self.batch_api:
+            return await self.__abatch_offline(text_batch, temperature, use_cache)
+        # concurrency is bounded by the process-wide scheduler, not per batch
+        return list(await asyncio.gather(*[self.__areq(text, temperature=temperature, priority=priority, use_cache=use_cache) for text in text_batch]))
+
+    async def abatch_chat(self, text_batch, temperature=0, priority=None, use_cache=True):
+        return await on_background_loop(self.__abatch_chat(text_batch, temperature, priority, use_cache))
+
+    def chat(self, text, temperature=1, priority=None, use_cache=True):
+        return run_sync(self.achat(text, temperature=temperature, priority=priority, use_cache=use_cache))
+
+    def batch_chat(self, text_batch, temperature=0, priority=None, use_cache=True):
+        return run_sync(self.abatch_chat(text_batch, temperature=temperature, priority=priority, use_cache=use_cache))
@@ -0,0 +1,90 @@
+import os
+import json
+import threading
+import h5py
+
+class PaperContentStore():
+    '''
+    Full texts stored as one HDF5 dataset per paper id.
+    A sidecar index (<file>.index.json) records the byte offset of every contiguous fixed-width dataset, so those texts
+    are read with a single pread; other datasets are opened by name through a handle that stays open between calls.
+    '''
+
+    def __init__(self, h5_path) -> None:
+        self.h5_path = h5_path
+        self.index_path = h5_path + '.index.json'
+        self._lock = threading.Lock()
+        self._file = None
+        self._fd = None
+        self._keys = None
+
+    def _h5(self):
+        if self._file is None:
+            self._file = h5py.File(self.h5_path, 'r')
+        return self._file
+
+    def _raw(self):
+        # writer threads read concurrently, the descriptor must only be opened once
+        if self._fd is None:
+            with self._lock:
+                if self._fd is None:
+                    self._fd = os.open(self.h5_path, os.O_RDONLY)
+        return self._fd
+
+    def _signature(self):
+        stat = os.stat(self.h5_path)
+        return [stat.st_size, int(stat.st_mtime)]
+
+    def build_index(self):
+        keys = {}
+        f = self._h5()
+        for key in f.keys():
+            ds = f[key]
+            offset = ds.id.get_offset()
+            if offset is not None and ds.shape == () and ds.chunks is None and ds.dtype.kind == 'S':
+                keys[key] = [offset, ds.id.get_storage_size()]
+            else:
+                keys[key] = None
+        with open(self.index_path + '.tmp', 'w') as out:
+            json.dump({'signature': self._signature(), 'keys': keys}, out)
+        os.replace(self.index_path + '.tmp', self.index_path)
+        return keys
+
+    def load_index(self):
+        if self._keys is None:
+            with self._lock:
+                if self._keys is None:
+                    keys = None
+                    if os.path.exists(self.index_path):
+                        with open(self.index_path, 'r') as f:
+                            saved = json.loads(f.read())
+                        if saved['signature'] == self._signature():
+                            keys = saved['keys']
+                    self._keys = keys if keys is not None else self.build_index()
+        return self._keys
+
+    def _read(self, key, entry):
+        if entry is not None:
+            value = os.pread(self._raw(), entry[1], entry[0]).rstrip(b'\x00')
+        else:
+            with self._lock:
+                value = self._h5()[key][()]
+        if isinstance(value, bytes):
+            return value.decode('utf-8', errors='ignore')
+        return str(value)
+
+    def get(self, ids):
+        keys = self.load_index()
+        missing = [_ for _ in ids if _ not in keys]
+        if missing:
+            raise KeyError(f'Papers not found in {self.h5_path}: {missing}')
+        texts = {key: self._read(key, keys[key]) for key in dict.fromkeys(ids)}
+        return [texts[_] for _ in ids]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,143 @@
+import re
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def estimate_tokens(text, output_allowance=0):
+    # ~4 characters per token for English; corrected by the usage the API reports once the request is done
+    return len(text) // 4 + 1 + output_allowance
+
+def parse_duration(value):
+    '''
+    Durations of the x-ratelimit-reset-* headers, e.g. "20ms", "6s" or "1m30.5s", in seconds.
+    '''
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    return sum(float(n) * DURATION_UNITS[u] for n, u in parts) if parts else None
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket():
+
+    def __init__(self, per_minute) -> None:
+        self.set_rate(per_minute)
+
+    def set_rate(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute or 0)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount):
+        if not self.per_minute:
+            return 0.0
+        self.refill()
+        # a request larger than the whole bucket only waits for a full bucket
+        return max(0.0, min(amount, self.per_minute) - self.level) * 60 / self.per_minute
+
+    def take(self, amount):
+        if self.per_minute:
+            self.level -= amount
+
+class RateLimiter():
+    '''
+    Client-side requests/min and tokens/min token buckets for one API, shared by every request of the process on the
+    background loop. Limits not set explicitly are taken from the x-ratelimit-limit-* response headers, a 429 or an
+    exhausted x-ratelimit-remaining-* pauses all requests until the server says the window resets, and retries back off
+    exponentially with full jitter unless the server sends Retry-After.
+    '''
+
+    def __init__(self, rpm=None, tpm=None, base_delay=1.0, max_delay=60.0) -> None:
+        self.explicit_rpm, self.explicit_tpm = bool(rpm), bool(tpm)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.base_delay, self.max_delay = base_delay, max_delay
+        self.paused_until = 0.0
+        self.throttled_requests, self.throttled_seconds = 0, 0.0
+        self.rate_limited, self.retries, self.backoff_seconds = 0, 0, 0.0
+
+    def configure(self, rpm=None, tpm=None):
+        if rpm:
+            self.explicit_rpm = True
+            self.requests.set_rate(rpm)
+        if tpm:
+            self.explicit_tpm = True
+            self.tokens.set_rate(tpm)
+
+    async def acquire(self, tokens):
+        start = time.monotonic()
+        while True:
+            wait = max(self.paused_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            self.throttled_requests += 1
+            self.throttled_seconds += waited
+
+    def record_usage(self, estimated, usage):
+        # charge the bucket with what the request actually used
+        if usage and usage.get('total_tokens') is not None:
+            self.tokens.take(usage['total_tokens'] - estimated)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        limit_requests, limit_tokens = headers.get('x-ratelimit-limit-requests'), headers.get('x-ratelimit-limit-tokens')
+        if limit_requests and not self.explicit_rpm and float(limit_requests) != self.requests.per_minute:
+            self.requests.set_rate(float(limit_requests))
+        if limit_tokens and not self.explicit_tpm and float(limit_tokens) != self.tokens.per_minute:
+            self.tokens.set_rate(float(limit_tokens))
+        for kind in ['requests', 'tokens']:
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if remaining is not None and reset and float(remaining) <= 0:
+                self.pause(reset)
+
+    def backoff(self, attempt, headers=None, status_code=None):
+        '''
+        Seconds to wait before retry number attempt + 1; a 429 also pauses every other request for that long.
+        '''
+        self.retries += 1
+        delay = parse_retry_after(headers.get('retry-after')) if headers is not None else None
+        if delay is None and headers is not None and status_code == 429:
+            delay = max([parse_duration(headers.get(f'x-ratelimit-reset-{kind}')) or 0 for kind in ['requests', 'tokens']]) or None
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if status_code == 429:
+            self.rate_limited += 1
+            self.pause(delay)
+        self.backoff_seconds += delay
+        return delay
+
+    def stats(self):
+        return {'rpm': self.requests.per_minute, 'tpm': self.tokens.per_minute,
+                'throttled_requests': self.throttled_requests, 'throttled_seconds': self.throttled_seconds,
+                'rate_limited': self.rate_limited, 'retries': self.retries, 'backoff_seconds': self.backoff_seconds}
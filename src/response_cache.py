@@ -0,0 +1,105 @@
+import time
+import json
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+class ResponseCache():
+    '''
+    On-disk cache of LLM responses, keyed on a hash of (model, api_url, temperature, prompt). Only deterministic
+    (temperature 0) calls are served from it unless cache_nondeterministic is set. When the stored responses exceed
+    max_bytes, the least recently used ones are evicted. Access times of hits are buffered in memory and written with
+    the next put, so a hit is a single read and never waits for a commit. The async methods run the SQLite work in a
+    worker thread, so a commit never stalls the other requests on the event loop.
+    '''
+
+    FLUSH_ACCESSES = 1024
+
+    def __init__(self, path, max_bytes=1 << 30, cache_nondeterministic=False) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.cache_nondeterministic = cache_nondeterministic
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._conn.commit()
+        self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self._accessed = {}
+
+    def key(self, model, api_url, temperature, prompt):
+        return hashlib.sha256(json.dumps([model, api_url, temperature, prompt]).encode('utf-8')).hexdigest()
+
+    def cacheable(self, temperature):
+        return temperature == 0 or self.cache_nondeterministic
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= self.FLUSH_ACCESSES:
+                self._flush_accessed()
+                self._conn.commit()
+            return row[0]
+
+    def _flush_accessed(self):
+        # called with the lock held, the caller commits
+        if self._accessed:
+            self._conn.executemany('UPDATE responses SET accessed = ? WHERE key = ?', [(t, k) for k, t in self._accessed.items()])
+            self._accessed = {}
+
+    def flush(self):
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+
+    def put(self, key, response):
+        self.put_many([(key, response)])
+
+    def put_many(self, items):
+        '''
+        items: [(key, response)], written with a single commit.
+        '''
+        with self._lock:
+            # eviction has to see the buffered access times
+            self._flush_accessed()
+            for key, response in items:
+                size = len(response.encode('utf-8'))
+                old = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                self._conn.execute('INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)', (key, response, size, time.time()))
+                self.total_bytes += size - (old[0] if old else 0)
+            while self.total_bytes > self.max_bytes:
+                victims = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed LIMIT 64').fetchall()
+                if not victims:
+                    break
+                for victim, victim_size in victims:
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (victim,))
+                    self.total_bytes -= victim_size
+                    self.evictions += 1
+            self._conn.commit()
+
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aget_many(self, keys):
+        return await asyncio.to_thread(lambda: [self.get(key) for key in keys])
+
+    async def aput(self, key, response):
+        await asyncio.to_thread(self.put, key, response)
+
+    async def aput_many(self, items):
+        await asyncio.to_thread(self.put_many, items)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'evictions': self.evictions, 'megabytes': self.total_bytes / 2**20}
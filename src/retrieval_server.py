@@ -0,0 +1,140 @@
+import json
+import threading
+import numpy as np
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+
+EXPOSED_METHODS = ['get_embeddings', 'get_embeddings_documents', 'get_ids_from_query', 'get_ids_from_queries', 'lexical_search',
+                   'get_titles_from_citations', 'get_date_from_ids', 'get_title_from_ids', 'get_abs_from_ids',
+                   'get_paper_info_from_ids', 'get_paper_from_ids', 'get_vectors']
+
+ERROR_TYPES = {'KeyError': KeyError, 'ValueError': ValueError, 'TypeError': TypeError}
+
+def to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [to_json(_) for _ in value]
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    return value
+
+def make_handler(db):
+    class RetrievalHandler(BaseHTTPRequestHandler):
+        # keep-alive, so a client session reuses one connection per thread
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, obj):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self.send_json(404, {'error_type': 'KeyError', 'error': f'Unknown path {self.path}'})
+            batcher = getattr(db, 'embedding_batcher', None)
+            self.send_json(200, {'status': 'ok', 'embedding_cache': db.embedding_cache.stats(),
+                                 'embedding_batcher': batcher.stats() if batcher is not None else None})
+
+        def do_POST(self):
+            method = self.path.strip('/')
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if method not in EXPOSED_METHODS:
+                return self.send_json(404, {'error_type': 'KeyError', 'error': f'Unknown method {method}'})
+            try:
+                result = getattr(db, method)(*request.get('args', []), **request.get('kwargs', {}))
+            except Exception as e:
+                return self.send_json(500, {'error_type': type(e).__name__, 'error': str(e)})
+            response = {'result': to_json(result)}
+            if method == 'get_titles_from_citations':
+                response['citation_stats'] = getattr(db, 'last_citation_stats', None)
+            self.send_json(200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RetrievalHandler
+
+def serve(db, host='127.0.0.1', port=8765):
+    server = ThreadingHTTPServer((host, port), make_handler(db))
+    server.daemon_threads = True
+    print(f'Retrieval server listening on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+class RemoteDatabase():
+    '''
+    Client of a running retrieval server, with the same retrieval methods as database, so it can be passed to
+    outlineWriter, subsectionWriter and Judge in its place. Every thread keeps its own keep-alive connection.
+    '''
+
+    def __init__(self, url=DEFAULT_URL, timeout=600) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def call(self, method, *args, **kwargs):
+        response = self.session().post(f'{self.url}/{method}', json={'args': to_json(list(args)), 'kwargs': to_json(kwargs)}, timeout=self.timeout)
+        body = response.json()
+        if response.status_code != 200:
+            raise ERROR_TYPES.get(body.get('error_type'), RuntimeError)(f"Retrieval server {method}: {body.get('error')}")
+        if 'citation_stats' in body:
+            self._local.last_citation_stats = body['citation_stats']
+        return body['result']
+
+    @property
+    def last_citation_stats(self):
+        return getattr(self._local, 'last_citation_stats', None)
+
+    def health(self):
+        return self.session().get(f'{self.url}/health', timeout=self.timeout).json()
+
+    def get_embeddings(self, batch_text):
+        return np.array(self.call('get_embeddings', batch_text), dtype='float32')
+
+    def get_embeddings_documents(self, batch_text):
+        return np.array(self.call('get_embeddings_documents', batch_text), dtype='float32')
+
+    def get_ids_from_query(self, query, num, shuffle = False, filters = None):
+        return self.call('get_ids_from_query', query, num, shuffle, filters)
+
+    def get_ids_from_queries(self, queries, num, shuffle = False, filters = None):
+        return self.call('get_ids_from_queries', queries, num, shuffle, filters)
+
+    def lexical_search(self, query, num, filters = None):
+        return self.call('lexical_search', query, num, filters)
+
+    def get_titles_from_citations(self, citations):
+        return self.call('get_titles_from_citations', citations)
+
+    def get_date_from_ids(self, ids):
+        return self.call('get_date_from_ids', ids)
+
+    def get_title_from_ids(self, ids):
+        return self.call('get_title_from_ids', ids)
+
+    def get_abs_from_ids(self, ids):
+        return self.call('get_abs_from_ids', ids)
+
+    def get_paper_info_from_ids(self, ids):
+        return self.call('get_paper_info_from_ids', ids)
+
+    def get_paper_from_ids(self, ids, max_len = 1500):
+        return self.call('get_paper_from_ids', ids, max_len)
+
+    def get_vectors(self, ids, title = False):
+        return np.array(self.call('get_vectors', ids, title), dtype='float32')
@@ -0,0 +1,75 @@
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 1, 2
+
+class RequestScheduler():
+    '''
+    Process-wide bound on in-flight LLM requests. Requests from every APIModel wait in one priority queue (lower value
+    first, FIFO within a priority) and at most max_in_flight run at once, however many agents and threads submit them.
+    All state is only touched from the event loop the requests run on, so no locking is needed.
+    '''
+
+    def __init__(self, max_in_flight=16) -> None:
+        self.max_in_flight = max_in_flight
+        self._queue = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self.submitted, self.queued, self.max_queue_length, self.total_wait = 0, 0, 0, 0.0
+
+    def _fill(self):
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, _, waiter = heapq.heappop(self._queue)
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._fill()
+
+    def set_max_in_flight(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self._fill()
+
+    async def acquire(self, priority=PRIORITY_NORMAL):
+        self.submitted += 1
+        if self._in_flight < self.max_in_flight and not self._queue:
+            self._in_flight += 1
+        else:
+            start = time.perf_counter()
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self.queued += 1
+            self.max_queue_length = max(self.max_queue_length, len(self._queue))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # the slot may have been handed over just before the cancellation
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                raise
+            self.total_wait += time.perf_counter() - start
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_NORMAL):
+        '''
+        Hold one in-flight slot for the duration of the block, e.g. while a streamed response is read.
+        '''
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run(self, coro_fn, priority=PRIORITY_NORMAL):
+        async with self.slot(priority):
+            return await coro_fn()
+
+    def stats(self):
+        return {'max_in_flight': self.max_in_flight, 'in_flight': self._in_flight, 'waiting': len(self._queue),
+                'submitted': self.submitted, 'queued': self.queued, 'max_queue_length': self.max_queue_length,
+                'mean_wait_ms': 1000 * self.total_wait / self.queued if self.queued else 0.0}
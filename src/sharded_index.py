@@ -0,0 +1,82 @@
+import os
+import json
+import numpy as np
+import faiss
+from concurrent.futures import ThreadPoolExecutor
+from src.filters import filtered_search
+from src.ann_index import reconstruct_rows
+
+SHARD_DIR = 'shards'
+SHARD_MANIFEST_FILE = 'shard_manifest.json'
+
+def load_shard_manifest(db_path):
+    with open(os.path.join(db_path, SHARD_MANIFEST_FILE), 'r') as f:
+        return json.loads(f.read())
+
+def save_shard_manifest(db_path, manifest):
+    path = os.path.join(db_path, SHARD_MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def merge_results(results, offsets, k, metric_type):
+    distances = np.concatenate([d for d, _ in results], axis=1)
+    labels = np.concatenate([np.where(i == -1, -1, i + offset) for (_, i), offset in zip(results, offsets)], axis=1)
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        keys = np.where(labels == -1, np.inf, -distances)
+    else:
+        keys = np.where(labels == -1, np.inf, distances)
+    order = np.argsort(keys, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+class ShardedIndex():
+    '''
+    Several faiss indexes searched in parallel as one. Shard i holds the global rows [offsets[i], offsets[i] + ntotal)
+    in order, so results merge back into the same row ids the unsharded index would return. faiss releases the GIL
+    while searching, so a thread pool keeps every shard busy at once.
+    '''
+
+    def __init__(self, shards, num_workers=None) -> None:
+        self.shards = shards
+        self.offsets = np.cumsum([0] + [s.ntotal for s in shards[:-1]]).astype('int64')
+        self.ntotal = int(sum(s.ntotal for s in shards))
+        self.d = shards[0].d
+        self.metric_type = shards[0].metric_type
+        self.pool = ThreadPoolExecutor(max_workers=num_workers or len(shards))
+
+    def search(self, x, k, rows=None):
+        if rows is None:
+            results = list(self.pool.map(lambda shard: shard.search(x, k), self.shards))
+        else:
+            def search_shard(i):
+                start, shard = self.offsets[i], self.shards[i]
+                local_rows = rows[(rows >= start) & (rows < start + shard.ntotal)] - start
+                return filtered_search(shard, x, k, local_rows)
+            results = list(self.pool.map(search_shard, range(len(self.shards))))
+        return merge_results(results, self.offsets, k, self.metric_type)
+
+    def reconstruct(self, key):
+        shard = int(np.searchsorted(self.offsets, key, side='right')) - 1
+        return self.shards[shard].reconstruct(int(key - self.offsets[shard]))
+
+    def reconstruct_batch(self, keys):
+        # one batch per shard, scattered back into the order of keys
+        keys = np.asarray(keys, dtype='int64')
+        shard_of = np.searchsorted(self.offsets, keys, side='right') - 1
+        vectors = np.zeros((len(keys), self.d), dtype='float32')
+        for shard in np.unique(shard_of):
+            where = np.flatnonzero(shard_of == shard)
+            vectors[where] = reconstruct_rows(self.shards[shard], keys[where] - self.offsets[shard])
+        return vectors
+
+def split_index(index, num_shards, factory='Flat', train_size=100000):
+    '''
+    Split the vectors of an index into num_shards contiguous row ranges, one new index per range.
+    '''
+    from src.ann_index import build_variant
+    bounds = np.linspace(0, index.ntotal, num_shards + 1).astype('int64')
+    shards = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        vectors = index.reconstruct_n(int(start), int(end - start))
+        shards.append(build_variant(vectors, factory, index.metric_type, train_size=train_size))
+    return shards
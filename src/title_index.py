@@ -0,0 +1,64 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+
+TITLE_INDEX_FILE = 'title_hash_index.json'
+
+def normalize_title(title):
+    '''
+    Case, accents, punctuation and whitespace are dropped, so "Semi-Supervised  Learning." and "semisupervised learning"
+    share a key.
+    '''
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    return re.sub(r'[^0-9a-z]+', '', title.lower())
+
+class TitleHashIndex():
+    '''
+    Normalized title -> paper id, built once from the metadata store and saved next to the database. The saved index is
+    rebuilt when the number of papers in the store changes.
+    '''
+
+    def __init__(self, db_path, metadata) -> None:
+        self.path = os.path.join(db_path, TITLE_INDEX_FILE)
+        self.metadata = metadata
+        self._titles = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._titles is None:
+            with self._lock:
+                if self._titles is None:
+                    num_papers = len(self.metadata)
+                    titles = None
+                    if os.path.exists(self.path):
+                        with open(self.path, 'r') as f:
+                            saved = json.loads(f.read())
+                        if saved['num_papers'] == num_papers:
+                            titles = saved['titles']
+                    if titles is None:
+                        titles = self.build(num_papers)
+                    self._titles = titles
+        return self._titles
+
+    def build(self, num_papers):
+        titles = {}
+        for r in self.metadata.iter_records():
+            key = normalize_title(r['title'])
+            # titles without any latin letter or digit all normalize to '' and would collide
+            if key:
+                titles.setdefault(key, r['id'])
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump({'num_papers': num_papers, 'titles': titles}, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f'Warning: could not save the title index to {self.path}: {e}')
+        return titles
+
+    def lookup(self, citation):
+        # an empty or punctuation-only citation is left to the embedding search
+        key = normalize_title(citation)
+        return self.load().get(key) if key else None
@@ -0,0 +1,104 @@
+import os
+import json
+import numpy as np
+import faiss
+from src.ann_index import reconstruct_rows
+
+VECTOR_DIR = 'vectors'
+VECTOR_MANIFEST_FILE = 'vector_manifest.json'
+FORMATS = ['fp16', 'pq']
+
+def load_vector_manifest(db_path):
+    path = os.path.join(db_path, VECTOR_DIR, VECTOR_MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.loads(f.read())
+
+def save_vector_manifest(db_path, manifest):
+    path = os.path.join(db_path, VECTOR_DIR, VECTOR_MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def encode_vectors(vectors, format, pq=None):
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if format == 'fp16':
+        return vectors.astype('float16')
+    return pq.compute_codes(vectors)
+
+def write_codes_atomic(path, num_rows, code_shape, dtype, chunks):
+    '''
+    Write an .npy array of num_rows rows chunk by chunk through a memory map, so the full array is never in RAM.
+    '''
+    out = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=(num_rows,) + code_shape)
+    start = 0
+    for chunk in chunks:
+        out[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    out.flush()
+    del out
+    os.replace(path + '.tmp', path)
+
+def build_vector_store(index, db_path, field, format='fp16', pq_m=64, pq_nbits=8, train_size=100000, seed=0, batch_size=100000):
+    '''
+    Copy the vectors of a flat index into a compact store aligned with its rows: float16 (half the size) or product
+    quantization codes (pq_m * pq_nbits / 8 bytes per vector).
+    '''
+    os.makedirs(os.path.join(db_path, VECTOR_DIR), exist_ok=True)
+    entry = {'format': format, 'd': index.d, 'ntotal': index.ntotal, 'file': os.path.join(VECTOR_DIR, f'{field}.{format}.npy')}
+    pq = None
+    if format == 'pq':
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(index.ntotal, min(train_size, index.ntotal), replace=False)
+        pq = faiss.ProductQuantizer(index.d, pq_m, pq_nbits)
+        pq.train(reconstruct_rows(index, np.sort(sample)))
+        entry['pq_file'] = os.path.join(VECTOR_DIR, f'{field}.pq.bin')
+        faiss.write_ProductQuantizer(pq, os.path.join(db_path, entry['pq_file']))
+    code_shape = (index.d,) if format == 'fp16' else (pq.code_size,)
+    dtype = 'float16' if format == 'fp16' else 'uint8'
+    chunks = (encode_vectors(index.reconstruct_n(start, min(batch_size, index.ntotal - start)), format, pq) for start in range(0, index.ntotal, batch_size))
+    write_codes_atomic(os.path.join(db_path, entry['file']), index.ntotal, code_shape, dtype, chunks)
+    manifest = load_vector_manifest(db_path)
+    manifest[field] = entry
+    save_vector_manifest(db_path, manifest)
+    return VectorStore(db_path, field)
+
+def extend_vector_store(db_path, field, vectors, committed):
+    manifest = load_vector_manifest(db_path)
+    if field not in manifest:
+        return
+    store = VectorStore(db_path, field)
+    if len(store) < committed:
+        raise ValueError(f'{store.path} holds {len(store)} vectors but the id map covers {committed} rows')
+    # rows beyond committed were appended by an ingest that was interrupted before its id map was written
+    codes = store.codes[:committed]
+    new_codes = encode_vectors(vectors, store.format, store.pq)
+    write_codes_atomic(store.path, committed + len(new_codes), codes.shape[1:], codes.dtype, [codes, new_codes])
+    manifest[field]['ntotal'] = committed + len(new_codes)
+    save_vector_manifest(db_path, manifest)
+
+class VectorStore():
+    '''
+    Memory-mapped embeddings aligned with the faiss rows of one field, stored as float16 or PQ codes under vectors/.
+    get() decodes only the requested rows.
+    '''
+
+    def __init__(self, db_path, field) -> None:
+        entry = load_vector_manifest(db_path)[field]
+        self.format = entry['format']
+        self.path = os.path.join(db_path, entry['file'])
+        self.codes = np.load(self.path, mmap_mode='r')
+        self.pq = faiss.read_ProductQuantizer(os.path.join(db_path, entry['pq_file'])) if self.format == 'pq' else None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def get(self, rows):
+        codes = np.ascontiguousarray(self.codes[np.asarray(rows, dtype='int64')])
+        if self.format == 'fp16':
+            return codes.astype('float32')
+        return self.pq.decode(codes)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试APIModel的离线Batch API模式(batch_api=True)，使用本地的files / batches桩服务器，不需要API密钥
+"""
+
+import os
+import sys
+import json
+import random
+import threading
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.model import APIModel, get_coalescer
+from src.batch_api import batch_base_url, read_batch_results
+
+class BatchHandler(BaseHTTPRequestHandler):
+    files, batches, polls = {}, {}, {}
+
+    def reply(self, payload, content_type='application/json'):
+        data = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/v1/files':
+            message = BytesParser(policy=default).parsebytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+            parts = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True) for part in message.iter_parts()}
+            assert parts['purpose'] == b'batch'
+            file_id = f'file-{len(self.files)}'
+            self.files[file_id] = parts['file'].decode('utf-8')
+            self.reply({'id': file_id})
+        elif self.path == '/v1/batches':
+            request = json.loads(body)
+            assert request['endpoint'] == '/v1/chat/completions'
+            batch_id = f'batch-{len(self.batches)}'
+            self.batches[batch_id] = request['input_file_id']
+            self.polls[batch_id] = 0
+            self.reply({'id': batch_id, 'status': 'validating'})
+
+    def do_GET(self):
+        if self.path.startswith('/v1/batches/'):
+            batch_id = self.path.rsplit('/', 1)[1]
+            self.polls[batch_id] += 1
+            if self.polls[batch_id] < 2:
+                self.reply({'id': batch_id, 'status': 'in_progress'})
+            else:
+                self.reply({'id': batch_id, 'status': 'completed', 'output_file_id': f'out-{batch_id}'})
+        elif self.path.startswith('/v1/files/out-'):
+            batch_id = self.path.split('/')[3][len('out-'):]
+            lines = []
+            for line in self.files[self.batches[batch_id]].splitlines():
+                request = json.loads(line)
+                prompt = request['body']['messages'][0]['content']
+                lines.append(json.dumps({'custom_id': request['custom_id'], 'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': prompt.upper()}}]}}}))
+            # output order is not guaranteed to match the input order
+            random.shuffle(lines)
+            self.reply('\n'.join(lines), 'application/jsonl')
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BatchHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+def test_batch_base_url():
+    """从chat completions的url得到files / batches接口的地址"""
+    assert batch_base_url('https://api.openai.com/v1/chat/completions') == ('https://api.openai.com/v1', '/v1/chat/completions')
+
+def test_read_batch_results():
+    """按custom_id还原请求顺序，失败的请求返回None"""
+    text = '\n'.join([json.dumps({'custom_id': '1', 'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': 'b'}}]}}}),
+                      json.dumps({'custom_id': '0', 'response': {'status_code': 500, 'body': {}}})])
+    assert read_batch_results(text, 3) == [None, 'b', None]
+
+def test_batch_chat_offline():
+    """batch_chat通过桩服务器上传、轮询并下载结果，结果与输入顺序一致"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url, batch_api=True, batch_poll_interval=0.05)
+    prompts = [f'claim {i}' for i in range(20)]
+    results = model.batch_chat(prompts, temperature=0)
+    server.shutdown()
+    assert results == [p.upper() for p in prompts]
+    assert len(BatchHandler.batches) == 1
+
+def test_duplicate_prompts_submitted_once():
+    """同一批次中相同的prompt只提交一次，结果分发给所有重复的请求"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url, batch_api=True, batch_poll_interval=0.05)
+    coalesced = get_coalescer().stats()['coalesced']
+    results = model.batch_chat(['same claim', 'other claim', 'same claim'], temperature=0)
+    batch_id = max(BatchHandler.batches, key=lambda b: int(b.split('-')[1]))
+    submitted = BatchHandler.files[BatchHandler.batches[batch_id]].splitlines()
+    server.shutdown()
+    assert results == ['SAME CLAIM', 'OTHER CLAIM', 'SAME CLAIM']
+    assert len(submitted) == 2
+    assert get_coalescer().stats()['coalesced'] == coalesced + 1
+
+if __name__ == "__main__":
+    test_batch_base_url()
+    test_read_batch_results()
+    test_batch_chat_offline()
+    test_duplicate_prompts_submitted_once()
+    print("\n✅ 所有测试通过！Batch API模式工作正常。")
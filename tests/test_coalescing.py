@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+测试APIModel合并相同的在途请求(src/coalescer.py)，使用本地的桩服务器，不需要API密钥
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.model import APIModel, get_coalescer
+from src.coalescer import RequestCoalescer
+
+RESPONSE_DELAY = 0.3
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    seen = Counter()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['messages'][0]['content']
+        self.seen[prompt] += 1
+        time.sleep(RESPONSE_DELAY)
+        if prompt.startswith('fail'):
+            # not retried, the request returns None
+            self.send_response(400)
+            data = b'{"error": "bad request"}'
+        else:
+            self.send_response(200)
+            data = json.dumps({'choices': [{'message': {'content': prompt.upper()}}]}).encode('utf-8')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+def test_identical_concurrent_chats_send_one_request():
+    """N个并发的相同调用只向服务器发送一次请求，所有调用得到相同的结果，合并计数为N-1"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    n = 8
+    coalesced = get_coalescer().stats()['coalesced']
+    with ThreadPoolExecutor(n) as pool:
+        results = list(pool.map(lambda _: model.chat('same prompt', temperature=0), range(n)))
+    server.shutdown()
+    assert CountingHandler.seen['same prompt'] == 1
+    assert results == ['SAME PROMPT'] * n
+    assert get_coalescer().stats()['coalesced'] == coalesced + n - 1
+    assert get_coalescer().stats()['in_flight'] == 0
+
+def test_nondeterministic_and_uncached_calls_are_not_coalesced():
+    """温度大于0或use_cache=False的调用各自发送"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    with ThreadPoolExecutor(3) as pool:
+        list(pool.map(lambda _: model.chat('sampled prompt', temperature=1), range(3)))
+        list(pool.map(lambda _: model.chat('fresh prompt', temperature=0, use_cache=False), range(3)))
+    server.shutdown()
+    assert CountingHandler.seen['sampled prompt'] == 3
+    assert CountingHandler.seen['fresh prompt'] == 3
+
+def test_cancelled_leader_does_not_cancel_followers():
+    """第一个调用者被取消时，请求继续进行，等待同一请求的其他调用者仍然得到结果"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+
+    async def run():
+        leader = asyncio.ensure_future(model.achat('cancelled leader', temperature=0))
+        await asyncio.sleep(RESPONSE_DELAY / 3)
+        follower = asyncio.ensure_future(model.achat('cancelled leader', temperature=0))
+        await asyncio.sleep(RESPONSE_DELAY / 3)
+        leader.cancel()
+        return await asyncio.wait_for(follower, timeout=5), leader
+    result, leader = asyncio.run(run())
+    server.shutdown()
+    assert leader.cancelled()
+    assert result == 'CANCELLED LEADER'
+    assert CountingHandler.seen['cancelled leader'] == 1
+
+def test_failed_leader_does_not_poison_later_calls():
+    """请求失败时所有等待者得到None，不会挂起；之后相同的调用重新发送请求"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: model.chat('fail prompt', temperature=0), range(4)))
+    assert results == [None] * 4
+    assert CountingHandler.seen['fail prompt'] == 1
+    assert model.chat('fail prompt', temperature=0) is None
+    server.shutdown()
+    assert CountingHandler.seen['fail prompt'] == 2
+    assert get_coalescer().stats()['in_flight'] == 0
+
+def test_exception_reaches_every_waiter():
+    """共享的请求抛出异常时，所有等待者都收到该异常，之后相同的键重新执行"""
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('upstream failed')
+
+    async def run():
+        return await asyncio.gather(*[coalescer.run('key', failing) for _ in range(3)], return_exceptions=True)
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1 and coalescer.stats()['coalesced'] == 2
+    assert len(asyncio.run(run())) == 3 and len(calls) == 2
+
+if __name__ == "__main__":
+    test_identical_concurrent_chats_send_one_request()
+    test_nondeterministic_and_uncached_calls_are_not_coalesced()
+    test_cancelled_leader_does_not_cancel_followers()
+    test_failed_leader_does_not_poison_later_calls()
+    test_exception_reaches_every_waiter()
+    print("\n✅ 所有测试通过！相同的在途请求只发送一次。")
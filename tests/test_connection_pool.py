@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试APIModel的连接池与后台事件循环(src/model.py)：多次调用复用同一个httpx.AsyncClient和keep-alive连接，
+多个线程同时调用chat / batch_chat以及在不同的事件循环中调用achat，使用本地的桩服务器，不需要API密钥
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.model import APIModel, background_loop
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.connections.add(self.client_address)
+        time.sleep(0.02)
+        data = json.dumps({'choices': [{'message': {'content': 'echo: ' + body['messages'][0]['content']}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    server.lock, server.requests, server.connections = threading.Lock(), 0, set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+def test_sequential_calls_reuse_one_connection():
+    """同一个模型的连续调用复用同一个客户端和同一条keep-alive连接"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    # temperature > 0 is neither coalesced nor cached, every call reaches the server
+    assert model.chat('first', temperature=1) == 'echo: first'
+    client = model._APIModel__client
+    for i in range(5):
+        assert model.chat(f'call {i}', temperature=1) == f'echo: call {i}'
+    assert model._APIModel__client is client
+    server.shutdown()
+    assert server.requests == 6 and len(server.connections) == 1
+
+def test_chat_and_batch_chat_from_many_threads():
+    """多个线程同时调用chat和batch_chat，每个调用得到自己的结果，连接数受max_connections限制并被复用"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url, max_connections=4)
+
+    def work(i):
+        single = model.chat(f'thread {i}', temperature=1)
+        batch = model.batch_chat([f'thread {i} item {j}' for j in range(3)], temperature=1)
+        return single, batch
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(work, range(8)))
+    server.shutdown()
+    for i, (single, batch) in enumerate(results):
+        assert single == f'echo: thread {i}'
+        assert batch == [f'echo: thread {i} item {j}' for j in range(3)]
+    assert server.requests == 8 * 4
+    assert len(server.connections) <= 4
+
+def test_achat_from_separate_event_loops():
+    """在不同线程的事件循环中调用achat，请求都在后台事件循环上执行，共享同一个客户端"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+
+    def run_in_own_loop(i):
+        async def run():
+            assert asyncio.get_running_loop() is not background_loop()
+            return await asyncio.gather(*[model.achat(f'loop {i} call {j}', temperature=1) for j in range(3)])
+        return asyncio.run(run())
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(run_in_own_loop, range(3)))
+    client = model._APIModel__client
+    assert model.chat('after', temperature=1) == 'echo: after'
+    server.shutdown()
+    assert results == [[f'echo: loop {i} call {j}' for j in range(3)] for i in range(3)]
+    assert model._APIModel__client is client
+
+if __name__ == "__main__":
+    test_sequential_calls_reuse_one_connection()
+    test_chat_and_batch_chat_from_many_threads()
+    test_achat_from_separate_event_loops()
+    print("\n✅ 所有测试通过！连接池与后台事件循环工作正常。")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试可断点续建的分块数据库构建(src/database_builder.py，db_tools.py build)：中断后继续构建的结果与一次性构建相同
+导入需要src/embedding.py的依赖(torch、sentence_transformers)；向量由固定的编码函数代替模型生成
+"""
+
+import os
+import sys
+import json
+import tempfile
+import numpy as np
+import faiss
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import src.database_builder as builder
+from src.ann_index import FIELDS, flat_index_path
+from src.id_map import ID_MAP_FILE
+from src.metadata_store import SQLiteMetadataStore, SQLITE_FILE
+
+DIM = 8
+
+class Interrupted(Exception):
+    pass
+
+def fixed_vectors(model, texts, batch_size=32, sort_by_length=False):
+    return np.array([[(sum(map(ord, t)) * (j + 1)) % 97 for j in range(DIM)] for t in texts], dtype='float32')
+
+def use_fixed_embeddings(fail_on_call=None):
+    '''
+    fail_on_call: raise on that call of embed_documents (1-based), to stop the build in the middle of a shard.
+    '''
+    calls = []
+
+    def embed(model, texts, batch_size=32, sort_by_length=False):
+        calls.append(len(texts))
+        if len(calls) == fail_on_call:
+            raise Interrupted()
+        return fixed_vectors(model, texts, batch_size, sort_by_length)
+    builder.load_embedding_model = lambda name, device='auto': None
+    builder.embed_documents = embed
+    return calls
+
+def write_source(path):
+    # 25 papers with a duplicate, so chunks of 10 give three shards
+    papers = [{'id': f'2401.{i:05d}', 'title': f'Paper {i}', 'abstract': f'Abstract of paper {i}.', 'date': '2024-01-01'} for i in range(24)]
+    papers.insert(12, dict(papers[3]))
+    with open(path, 'w') as f:
+        for p in papers:
+            f.write(json.dumps(p) + '\n')
+
+def build(db_path, source):
+    builder.build_shards(source, db_path, 'fixed', chunk_size=10)
+    return builder.finalize_build(db_path)
+
+def snapshot(db_path):
+    with open(os.path.join(db_path, ID_MAP_FILE), 'r') as f:
+        id_to_index = json.loads(f.read())
+    vectors = {field: faiss.read_index(flat_index_path(db_path, field)).reconstruct_n(0, len(id_to_index)) for field in FIELDS}
+    records = list(SQLiteMetadataStore(os.path.join(db_path, SQLITE_FILE)).iter_records())
+    return id_to_index, vectors, records
+
+def test_resumed_build_matches_one_shot_build():
+    """在第二个分块的标题向量处中断，继续构建后的索引、id映射与元数据和一次性构建完全相同，已完成的分块不重新编码"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'papers.jsonl')
+        write_source(source)
+        one_shot, resumed = os.path.join(tmp, 'one_shot'), os.path.join(tmp, 'resumed')
+        use_fixed_embeddings()
+        assert build(one_shot, source) == 24
+
+        # shard 0 embeds abs and title (calls 1 and 2), shard 1 fails on its title embeddings (call 4)
+        use_fixed_embeddings(fail_on_call=4)
+        try:
+            build(resumed, source)
+            assert False, 'the build should have been interrupted'
+        except Interrupted:
+            pass
+        assert os.path.exists(builder.shard_path(os.path.join(resumed, builder.BUILD_DIR), 0, 'json'))
+        assert not os.path.exists(builder.shard_path(os.path.join(resumed, builder.BUILD_DIR), 1, 'json'))
+
+        calls = use_fixed_embeddings()
+        assert build(resumed, source) == 24
+        # only shards 1 and 2 are embedded again
+        assert len(calls) == 2 * len(FIELDS)
+
+        expected, found = snapshot(one_shot), snapshot(resumed)
+        assert found[0] == expected[0]
+        for field in FIELDS:
+            assert np.array_equal(found[1][field], expected[1][field])
+        assert found[2] == expected[2]
+
+if __name__ == "__main__":
+    test_resumed_build_matches_one_shot_build()
+    print("\n✅ 所有测试通过！断点续建与一次性构建的结果一致。")
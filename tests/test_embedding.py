@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试查询编码器的加载选项(src/embedding.py)：设备、线程数与int8动态量化生效，量化后的向量与fp32的向量保持接近
+需要torch和sentence_transformers，第一次运行时下载编码模型(默认为较小的all-MiniLM-L6-v2，可用EMBEDDING_TEST_MODEL指定)
+"""
+
+import os
+import sys
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.embedding import load_embedding_model, resolve_device, embed_documents, cosine_similarity_rows, BENCHMARK_QUERIES
+
+MODEL = os.environ.get('EMBEDDING_TEST_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+
+def linear_layers(model):
+    return [m for m in model.modules() if type(m) is torch.nn.Linear]
+
+def quantized_layers(model):
+    return [m for m in model.modules() if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+
+def test_device_and_threads():
+    """auto在没有GPU时选择CPU；模型加载到指定的设备，num_threads设置torch的线程数"""
+    assert resolve_device('auto') == ('cuda' if torch.cuda.is_available() else 'cpu')
+    assert resolve_device('cpu') == 'cpu'
+    model = load_embedding_model(MODEL, device='cpu', num_threads=2)
+    assert model.device.type == 'cpu'
+    assert torch.get_num_threads() == 2
+    assert not model.training
+
+def test_int8_quantization_stays_close_to_fp32():
+    """int8量化替换所有Linear层，编码结果与fp32的余弦相似度接近1，检索排序基本不变"""
+    reference = load_embedding_model(MODEL, device='cpu')
+    quantized = load_embedding_model(MODEL, device='cpu', quantize='int8')
+    assert linear_layers(reference) and not quantized_layers(reference)
+    assert quantized_layers(quantized) and not linear_layers(quantized)
+
+    ref = reference.encode(BENCHMARK_QUERIES)
+    found = quantized.encode(BENCHMARK_QUERIES)
+    assert cosine_similarity_rows(ref, found).min() > 0.95
+    # the nearest other query of each query is mostly unchanged
+    ref_sim, found_sim = ref @ ref.T, found @ found.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(found_sim, -np.inf)
+    assert (ref_sim.argmax(axis=1) == found_sim.argmax(axis=1)).mean() >= 0.8
+
+def test_unsupported_options():
+    """未知的量化方式报错"""
+    try:
+        load_embedding_model(MODEL, device='cpu', quantize='fp4')
+        assert False, 'an unknown quantization mode should be rejected'
+    except ValueError:
+        pass
+
+def test_embed_documents_keeps_input_order():
+    """按长度排序分批编码时，结果仍按输入顺序返回"""
+    model = load_embedding_model(MODEL, device='cpu')
+    texts = ['a much longer document about retrieval augmented generation and citations', 'short', 'medium length text']
+    plain = embed_documents(model, texts, batch_size=2)
+    by_length = embed_documents(model, texts, batch_size=2, sort_by_length=True)
+    assert cosine_similarity_rows(plain, by_length).min() > 0.999
+
+if __name__ == "__main__":
+    test_device_and_threads()
+    test_int8_quantization_stays_close_to_fp32()
+    test_unsupported_options()
+    test_embed_documents_keeps_input_order()
+    print("\n✅ 所有测试通过！编码器的设备与量化选项工作正常。")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+测试查询向量的微批处理(src/embedding_batcher.py)：并发线程的请求合并为共享的编码批次
+"""
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.embedding_batcher import EmbeddingBatcher
+
+class SlowEncoder():
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return np.array([[len(t), sum(map(ord, t))] for t in texts], dtype='float32')
+
+def test_concurrent_requests_share_batches():
+    """并发的请求合并为少数几个批次，每个调用者得到自己文本的向量"""
+    encoder = SlowEncoder()
+    batcher = EmbeddingBatcher(encoder, max_wait=0.05, max_batch_size=64)
+    queries = [[f'query {i}', 'shared query'] for i in range(16)]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(batcher.encode, queries))
+    for texts, vectors in zip(queries, results):
+        assert np.array_equal(vectors, encoder(texts))
+    stats = batcher.stats()
+    assert stats['requests'] == 16 and stats['batches'] < 16
+    # the shared text is encoded once per batch
+    assert all(batch.count('shared query') == 1 for batch in encoder.batches[:stats['batches']])
+
+def test_max_batch_size():
+    """批次大小不超过max_batch_size（单个请求本身更大时除外）"""
+    encoder = SlowEncoder()
+    batcher = EmbeddingBatcher(encoder, max_wait=0.05, max_batch_size=4)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(batcher.encode, [[f'q{i}', f'r{i}'] for i in range(8)]))
+    assert max(len(b) for b in encoder.batches) <= 4
+    assert len(batcher.encode([f'big {i}' for i in range(10)])) == 10
+
+def test_encoder_error_reaches_callers():
+    """编码失败时异常传给这一批次的调用者，之后的请求照常处理"""
+    calls = []
+
+    def flaky(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError('encoder failed')
+        return np.zeros((len(texts), 2), dtype='float32')
+    batcher = EmbeddingBatcher(flaky, max_wait=0.001)
+    try:
+        batcher.encode(['a'])
+        assert False, 'the encoder error should be raised'
+    except RuntimeError:
+        pass
+    assert batcher.encode(['b']).shape == (1, 2)
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_batches()
+    test_max_batch_size()
+    test_encoder_error_reaches_callers()
+    print("\n✅ 所有测试通过！查询向量微批处理工作正常。")
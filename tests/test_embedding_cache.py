@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试查询向量缓存(src/embedding_cache.py)：只编码缺失的文本、重复文本只编码一次、内存LRU以及磁盘缓存
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.embedding_cache import EmbeddingCache
+
+class CountingEncoder():
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[len(t), ord(t[0]) if t else 0] for t in texts], dtype='float32')
+
+def test_only_missing_texts_are_encoded():
+    """已缓存的文本不再编码；同一批中的重复文本只编码一次，结果按输入顺序返回"""
+    cache = EmbeddingCache('model')
+    encoder = CountingEncoder()
+    first = cache.get_or_compute(['alpha', 'beta', 'alpha'], encoder)
+    assert encoder.batches == [['alpha', 'beta']]
+    assert np.array_equal(first[0], first[2])
+    second = cache.get_or_compute(['beta', 'gamma'], encoder)
+    assert encoder.batches[-1] == ['gamma']
+    assert np.array_equal(second[0], first[1])
+    stats = cache.stats()
+    assert stats['misses'] == 3 and stats['memory_hits'] == 1
+
+def test_memory_lru_and_model_key():
+    """超过内存容量时淘汰最久未用的向量；不同模型的缓存互不影响"""
+    cache = EmbeddingCache('model', max_memory_items=2)
+    encoder = CountingEncoder()
+    cache.get_or_compute(['a', 'b'], encoder)
+    cache.get_or_compute(['a'], encoder)
+    cache.get_or_compute(['c'], encoder)
+    cache.get_or_compute(['b'], encoder)
+    assert encoder.batches[-1] == ['b']
+    assert EmbeddingCache('model').key('a') != EmbeddingCache('other-model').key('a')
+
+def test_disk_cache_survives_restart():
+    """磁盘缓存在新的进程(新的缓存对象)中仍然命中"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'embeddings.sqlite')
+        encoder = CountingEncoder()
+        vectors = EmbeddingCache('model', cache_path=path).get_or_compute(['query one', 'query two'], encoder)
+        reopened = EmbeddingCache('model', cache_path=path)
+        assert np.array_equal(reopened.get_or_compute(['query two', 'query one'], encoder), vectors[::-1])
+        assert len(encoder.batches) == 1
+        assert reopened.stats()['disk_hits'] == 2
+
+if __name__ == "__main__":
+    test_only_missing_texts_are_encoded()
+    test_memory_lru_and_model_key()
+    test_disk_cache_survives_restart()
+    print("\n✅ 所有测试通过！查询向量缓存工作正常。")
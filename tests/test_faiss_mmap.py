@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+测试以内存映射方式读取faiss索引(src/ann_index.py的read_index，database的faiss_mmap选项使用它)：精确索引与IVF索引都能读取和检索
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import faiss
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.ann_index import VARIANTS, build_variant, read_index, mmap_io_flags
+
+def make_indexes(tmp, n=2000, d=16):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, d)).astype('float32')
+    flat = faiss.IndexFlatIP(d)
+    flat.add(vectors)
+    indexes = {'flat': flat,
+               'ivfpq': build_variant(vectors, VARIANTS['ivfpq'].format(nlist=16, pq_m=4) + 'x4', faiss.METRIC_INNER_PRODUCT),
+               'ivfsq8': build_variant(vectors, VARIANTS['ivfsq8'].format(nlist=16), faiss.METRIC_INNER_PRODUCT),
+               'hnsw': build_variant(vectors, VARIANTS['hnsw'].format(hnsw_m=16), faiss.METRIC_INNER_PRODUCT)}
+    paths = {}
+    for name, index in indexes.items():
+        paths[name] = os.path.join(tmp, f'{name}.bin')
+        faiss.write_index(index, paths[name])
+    return vectors, indexes, paths
+
+def test_mmap_indexes_search_like_in_memory():
+    """每种索引以内存映射方式读取后都能检索，结果与读入内存的索引相同"""
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors, indexes, paths = make_indexes(tmp)
+        for name, path in paths.items():
+            mapped = read_index(path, mmap=True, nprobe=4, ef_search=64)
+            loaded = read_index(path, nprobe=4, ef_search=64)
+            assert mapped.ntotal == len(vectors)
+            d_mapped, i_mapped = mapped.search(vectors[:5], 10)
+            d_loaded, i_loaded = loaded.search(vectors[:5], 10)
+            assert np.array_equal(i_mapped, i_loaded), name
+            assert (i_mapped != -1).all(), name
+        assert faiss.extract_index_ivf(read_index(paths['ivfpq'], mmap=True, nprobe=4)).nprobe == 4
+
+def test_io_flags_per_index_type():
+    """IVF索引只使用IO_FLAG_MMAP，其他索引不同时使用两个标志"""
+    with tempfile.TemporaryDirectory() as tmp:
+        _, _, paths = make_indexes(tmp)
+        assert mmap_io_flags(paths['ivfpq']) == faiss.IO_FLAG_MMAP
+        assert mmap_io_flags(paths['ivfsq8']) == faiss.IO_FLAG_MMAP
+        assert mmap_io_flags(paths['flat']) == getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+
+if __name__ == "__main__":
+    test_mmap_indexes_search_like_in_memory()
+    test_io_flags_per_index_type()
+    print("\n✅ 所有测试通过！faiss索引的内存映射读取工作正常。")
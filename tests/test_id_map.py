@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试论文id与faiss行号的映射(src/id_map.py)：双向查询、未知id、内存映射加载以及JSON变化后重建
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.id_map import IdMap, ID_MAP_FILE, ID_MAP_DIR
+
+ID_TO_INDEX = {'2401.00001': 0, '2401.00002': 2, 'cs/0501001': 1, '1706.03762': 4}
+
+def write_json(db_path, id_to_index):
+    with open(os.path.join(db_path, ID_MAP_FILE), 'w') as f:
+        json.dump(id_to_index, f)
+
+def test_lookup_both_ways():
+    """按id查行号、按行号查id；不存在的id和比存储宽度更长的id返回-1"""
+    id_map = IdMap.from_dict(ID_TO_INDEX)
+    assert len(id_map) == 5
+    assert id_map.rows(['1706.03762', 'missing', '2401.00001']).tolist() == [4, -1, 0]
+    assert id_map.rows(['2401.000011']).tolist() == [-1]
+    assert id_map.get('cs/0501001') == 1 and id_map.get('missing') is None
+    assert 'cs/0501001' in id_map and 'missing' not in id_map
+    assert id_map.ids([2, 4]) == ['2401.00002', '1706.03762']
+    assert id_map.id(1) == 'cs/0501001'
+    assert IdMap.from_dict({}).rows(['x']).tolist() == [-1]
+
+def test_iter_rows():
+    """按块批量查询记录的行号，跳过不在映射中的记录，结果与逐个查询一致"""
+    id_map = IdMap.from_dict(ID_TO_INDEX)
+    records = [{'id': id} for id in ['cs/0501001', 'missing', '1706.03762', '2401.00001']]
+    found = list(id_map.iter_rows(iter(records), chunk_size=3))
+    assert [(row, r['id']) for row, r in found] == [(1, 'cs/0501001'), (4, '1706.03762'), (0, '2401.00001')]
+    assert all(id_map.get(r['id']) == row for row, r in found)
+
+def test_load_is_memory_mapped_and_rebuilt_on_change():
+    """保存的数组以内存映射方式加载；JSON文件变化后自动重建"""
+    with tempfile.TemporaryDirectory() as db_path:
+        write_json(db_path, ID_TO_INDEX)
+        IdMap.build(db_path)
+        assert os.path.exists(os.path.join(db_path, ID_MAP_DIR, 'ids.npy'))
+        loaded = IdMap.load(db_path)
+        assert isinstance(loaded.ids_array, np.memmap)
+        assert loaded.get('1706.03762') == 4
+
+        time.sleep(0.01)
+        write_json(db_path, dict(ID_TO_INDEX, **{'2402.00001': 5}))
+        reloaded = IdMap.load(db_path)
+        assert not isinstance(reloaded.ids_array, np.memmap)
+        assert reloaded.get('2402.00001') == 5 and len(reloaded) == 6
+
+if __name__ == "__main__":
+    test_lookup_both_ways()
+    test_iter_rows()
+    test_load_is_memory_mapped_and_rebuilt_on_change()
+    print("\n✅ 所有测试通过！id映射工作正常。")
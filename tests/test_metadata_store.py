@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试论文元数据存储(src/metadata_store.py)：TinyDB转换为SQLite、按id查询以及增量写入新记录
+"""
+
+import os
+import sys
+import json
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.metadata_store import (TINYDB_FILE, SQLITE_FILE, TABLE_NAME, convert_tinydb_to_sqlite, add_records,
+                                open_metadata_store, SQLiteMetadataStore)
+
+RECORDS = [{'id': f'2401.{i:05d}', 'title': f'Paper {i}', 'date': f'2024-01-{i + 1:02d}'} for i in range(5)]
+
+def write_tinydb(db_path, records):
+    with open(os.path.join(db_path, TINYDB_FILE), 'w') as f:
+        json.dump({TABLE_NAME: {str(i + 1): r for i, r in enumerate(records)}}, f)
+
+def test_convert_and_get():
+    """转换后的SQLite存储按请求的顺序返回记录，跳过不存在和重复的id"""
+    with tempfile.TemporaryDirectory() as db_path:
+        write_tinydb(db_path, RECORDS)
+        assert convert_tinydb_to_sqlite(os.path.join(db_path, TINYDB_FILE), os.path.join(db_path, SQLITE_FILE)) == len(RECORDS)
+        store = open_metadata_store(db_path)
+        assert isinstance(store, SQLiteMetadataStore)
+        assert len(store) == len(RECORDS)
+        ids = [RECORDS[3]['id'], 'missing', RECORDS[0]['id'], RECORDS[3]['id']]
+        assert [r['id'] for r in store.get(ids)] == [RECORDS[3]['id'], RECORDS[0]['id']]
+        assert [r['id'] for r in store.iter_records()] == [r['id'] for r in RECORDS]
+
+def test_add_records_tinydb():
+    """TinyDB后端一次性写入新记录，不留下临时文件；重复执行中断的写入不会产生重复记录"""
+    with tempfile.TemporaryDirectory() as db_path:
+        write_tinydb(db_path, RECORDS[:3])
+        add_records(db_path, RECORDS[3:])
+        add_records(db_path, RECORDS[3:])
+        assert not os.path.exists(os.path.join(db_path, TINYDB_FILE + '.tmp'))
+        store = open_metadata_store(db_path, backend='tinydb')
+        assert len(store) == len(RECORDS)
+        assert [r['title'] for r in store.get([RECORDS[4]['id']])] == ['Paper 4']
+
+def test_add_records_sqlite():
+    """存在SQLite存储时新记录同时写入SQLite和仍然存在的TinyDB文件，两个后端读到相同的记录；只有SQLite时不创建TinyDB文件"""
+    with tempfile.TemporaryDirectory() as db_path:
+        write_tinydb(db_path, RECORDS[:3])
+        convert_tinydb_to_sqlite(os.path.join(db_path, TINYDB_FILE), os.path.join(db_path, SQLITE_FILE))
+        add_records(db_path, RECORDS[3:])
+        assert len(open_metadata_store(db_path)) == len(RECORDS)
+        tinydb = open_metadata_store(db_path, backend='tinydb')
+        assert len(tinydb) == len(RECORDS)
+        assert [r['title'] for r in tinydb.get([RECORDS[4]['id']])] == ['Paper 4']
+
+        os.remove(os.path.join(db_path, TINYDB_FILE))
+        add_records(db_path, [dict(RECORDS[0], id='2402.00001')])
+        assert len(open_metadata_store(db_path)) == len(RECORDS) + 1
+        assert not os.path.exists(os.path.join(db_path, TINYDB_FILE))
+
+if __name__ == "__main__":
+    test_convert_and_get()
+    test_add_records_tinydb()
+    test_add_records_sqlite()
+    print("\n✅ 所有测试通过！元数据存储工作正常。")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+测试客户端限流(src/rate_limiter.py)：限流头与Retry-After的解析、令牌桶等待时间、从响应头读取配额以及退避
+"""
+
+import os
+import sys
+import time
+import asyncio
+from email.utils import formatdate
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.rate_limiter import RateLimiter, TokenBucket, parse_duration, parse_retry_after
+
+def test_parse_headers():
+    """解析x-ratelimit-reset-*的时长格式和Retry-After的秒数或HTTP日期"""
+    assert parse_duration('20ms') == 0.02
+    assert parse_duration('1m30.5s') == 90.5
+    assert parse_duration('6') == 6.0
+    assert parse_duration('soon') is None and parse_duration(None) is None
+    assert parse_retry_after('3') == 3.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after('garbage') is None
+
+def test_token_bucket_wait_time():
+    """桶内额度用完后按速率计算等待时间；超过整个桶的请求只等待一个满桶"""
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(1) == 0
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    assert bucket.wait_time(600) <= 60
+    assert TokenBucket(None).wait_time(10 ** 6) == 0
+
+def test_limits_from_headers_and_pause():
+    """没有显式设置的配额从响应头读取；剩余额度为0时暂停所有请求直到窗口重置"""
+    limiter = RateLimiter(tpm=1000)
+    limiter.update_from_headers({'x-ratelimit-limit-requests': '500', 'x-ratelimit-limit-tokens': '90000',
+                                 'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '50ms'})
+    assert limiter.requests.per_minute == 500 and limiter.tokens.per_minute == 1000
+    start = time.monotonic()
+    asyncio.run(limiter.acquire(10))
+    assert time.monotonic() - start >= 0.04
+    assert limiter.stats()['throttled_requests'] == 1
+
+def test_backoff():
+    """429响应遵循Retry-After并暂停其他请求；没有提示时使用带抖动的指数退避"""
+    limiter = RateLimiter(max_delay=8)
+    assert limiter.backoff(0, {'retry-after': '2'}, 429) == 2.0
+    assert limiter.paused_until > time.monotonic() + 1.5
+    assert limiter.backoff(0, {'x-ratelimit-reset-tokens': '1.5s'}, 429) == 1.5
+    assert all(0 <= limiter.backoff(10, {}, 503) <= 8 for _ in range(20))
+    stats = limiter.stats()
+    assert stats['rate_limited'] == 2 and stats['retries'] == 22
+
+if __name__ == "__main__":
+    test_parse_headers()
+    test_token_bucket_wait_time()
+    test_limits_from_headers_and_pause()
+    test_backoff()
+    print("\n✅ 所有测试通过！客户端限流工作正常。")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试LLM响应缓存(src/response_cache.py)：命中与未命中、只缓存确定性调用、最近最少使用的淘汰、命中时不提交写入，以及异步读写不阻塞事件循环
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.response_cache import ResponseCache
+
+def test_get_put_and_cacheable():
+    """按(模型, url, 温度, prompt)缓存；默认只缓存温度为0的调用"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'responses.sqlite'))
+        key = cache.key('model', 'url', 0, 'prompt')
+        assert key != cache.key('model', 'url', 0.5, 'prompt')
+        assert cache.get(key) is None
+        cache.put(key, 'response')
+        assert cache.get(key) == 'response'
+        assert cache.cacheable(0) and not cache.cacheable(1)
+        assert ResponseCache(os.path.join(tmp, 'other.sqlite'), cache_nondeterministic=True).cacheable(1)
+        stats = cache.stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+
+def test_lru_eviction_uses_buffered_hits():
+    """超出大小限制时淘汰最近最少使用的响应；缓冲的命中时间在淘汰前写入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'responses.sqlite'), max_bytes=30)
+        keys = [cache.key('model', 'url', 0, str(i)) for i in range(4)]
+        for k in keys[:3]:
+            cache.put(k, 'x' * 10)
+        # the oldest entry was read last, so the second one is the least recently used
+        assert cache.get(keys[0]) == 'x' * 10
+        cache.put(keys[3], 'x' * 10)
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None and cache.get(keys[3]) is not None
+        assert cache.stats()['evictions'] == 1
+
+def test_hits_do_not_commit():
+    """命中只读取数据库，访问时间在put或flush时批量写入，并在重新打开后保留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'responses.sqlite')
+        cache = ResponseCache(path)
+        key = cache.key('model', 'url', 0, 'prompt')
+        cache.put(key, 'response')
+        before = cache._conn.total_changes
+        for _ in range(10):
+            cache.get(key)
+        assert cache._conn.total_changes == before
+        cache.flush()
+        assert cache._conn.total_changes == before + 1
+        assert ResponseCache(path).get(key) == 'response'
+
+def test_async_access_does_not_block_the_event_loop():
+    """异步读写在工作线程中执行：等待数据库时事件循环上的其他任务照常运行；put_many一次写入多条响应"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'responses.sqlite'))
+        keys = [cache.key('model', 'url', 0, f'prompt {i}') for i in range(3)]
+        before = cache._conn.total_changes
+
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+            task = asyncio.ensure_future(ticker())
+            await asyncio.sleep(0)
+            # a slow commit elsewhere holds the lock, the lookup waits in its worker thread
+            with cache._lock:
+                lookup = asyncio.ensure_future(cache.aget(keys[0]))
+                await asyncio.sleep(0.2)
+            assert await lookup is None
+            await cache.aput_many([(key, f'response {i}') for i, key in enumerate(keys)])
+            task.cancel()
+            return ticks, await cache.aget_many(keys)
+        ticks, responses = asyncio.run(run())
+        assert ticks >= 10
+        assert responses == ['response 0', 'response 1', 'response 2']
+        assert cache._conn.total_changes == before + 3
+
+if __name__ == "__main__":
+    test_get_put_and_cacheable()
+    test_lru_eviction_uses_buffered_hits()
+    test_hits_do_not_commit()
+    test_async_access_does_not_block_the_event_loop()
+    print("\n✅ 所有测试通过！响应缓存工作正常。")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试全局LLM请求调度器(src/scheduler.py)：并发上限、按优先级出队以及取消时释放槽位
+"""
+
+import os
+import sys
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.scheduler import RequestScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+def test_max_in_flight():
+    """同时运行的请求数不超过max_in_flight"""
+    scheduler = RequestScheduler(max_in_flight=3)
+    running, peak = [0], [0]
+
+    async def request():
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return 'ok'
+
+    async def run():
+        return await asyncio.gather(*[scheduler.run(request) for _ in range(20)])
+    assert asyncio.run(run()) == ['ok'] * 20
+    assert peak[0] == 3
+    stats = scheduler.stats()
+    assert stats['submitted'] == 20 and stats['queued'] == 17 and stats['in_flight'] == 0
+
+def test_priority_order():
+    """排队的请求按优先级出队，同一优先级内先进先出"""
+    scheduler = RequestScheduler(max_in_flight=1)
+    order = []
+
+    def request(name):
+        async def run():
+            order.append(name)
+            await asyncio.sleep(0.001)
+        return run
+
+    async def run():
+        blocker = asyncio.ensure_future(scheduler.run(request('blocker')))
+        await asyncio.sleep(0)
+        jobs = [scheduler.run(request('low'), PRIORITY_LOW), scheduler.run(request('normal 1'), PRIORITY_NORMAL),
+                scheduler.run(request('high'), PRIORITY_HIGH), scheduler.run(request('normal 2'), PRIORITY_NORMAL)]
+        await asyncio.gather(blocker, *jobs)
+    asyncio.run(run())
+    assert order == ['blocker', 'high', 'normal 1', 'normal 2', 'low']
+
+def test_cancelled_waiter_releases_slot():
+    """排队中被取消的请求不占用槽位；set_max_in_flight立即放行排队的请求"""
+    scheduler = RequestScheduler(max_in_flight=1)
+
+    async def run():
+        async with scheduler.slot():
+            waiter = asyncio.ensure_future(scheduler.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+        assert scheduler.stats()['in_flight'] == 0
+
+        async with scheduler.slot():
+            second = asyncio.ensure_future(scheduler.run(lambda: asyncio.sleep(0, result='done')))
+            await asyncio.sleep(0)
+            assert not second.done()
+            scheduler.set_max_in_flight(2)
+            assert await asyncio.wait_for(second, timeout=1) == 'done'
+    asyncio.run(run())
+    assert scheduler.stats()['in_flight'] == 0
+
+if __name__ == "__main__":
+    test_max_in_flight()
+    test_priority_order()
+    test_cancelled_waiter_releases_slot()
+    print("\n✅ 所有测试通过！请求调度器工作正常。")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+测试APIModel的流式输出(stream_chat / astream_chat)，使用本地的SSE桩服务器，不需要API密钥
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.model import APIModel, get_scheduler
+
+CHUNKS = ['Large ', 'language ', 'models ', 'for ', 'education.']
+CHUNK_DELAY = 0.05
+
+class StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        assert body['stream'] is True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in CHUNKS + [None]:
+                time.sleep(CHUNK_DELAY)
+                if chunk is None:
+                    event = 'data: [DONE]\n\n'
+                else:
+                    event = 'data: ' + json.dumps({'choices': [{'delta': {'content': chunk}}]}) + '\n\n'
+                data = event.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading early
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/v1/chat/completions'
+
+def test_stream_chat():
+    """流式输出按块到达，首个token的时间远小于整个响应的时间"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    ttfts = []
+    start = time.perf_counter()
+    arrivals = []
+    for delta in model.stream_chat('hello', on_first_token=ttfts.append):
+        arrivals.append((time.perf_counter() - start, delta))
+    total = time.perf_counter() - start
+    server.shutdown()
+
+    assert ''.join(d for _, d in arrivals) == ''.join(CHUNKS)
+    assert len(arrivals) == len(CHUNKS)
+    assert len(ttfts) == 1 and ttfts[0] < total - 2 * CHUNK_DELAY
+    assert model.stream_stats()['streams'] == 1
+    print(f'TTFT {ttfts[0] * 1000:.0f} ms, full response {total * 1000:.0f} ms')
+
+def test_partial_output_written_early():
+    """下游消费者可以在响应结束之前把部分内容写入磁盘"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'section.md')
+        sizes = []
+        with open(path, 'w') as f:
+            for delta in model.stream_chat('write a section'):
+                f.write(delta)
+                f.flush()
+                sizes.append(os.path.getsize(path))
+        with open(path, 'r') as f:
+            assert f.read() == ''.join(CHUNKS)
+    server.shutdown()
+    assert sizes[0] < sizes[-1]
+
+def test_astream_chat_and_early_stop():
+    """在其他事件循环中使用astream_chat；提前停止时释放调度器的并发槽位"""
+    server, url = start_stub_server()
+    model = APIModel('stub-model', 'no-key', url)
+
+    async def consume():
+        return [delta async for delta in model.astream_chat('hello')]
+    assert ''.join(asyncio.run(consume())) == ''.join(CHUNKS)
+
+    stream = model.stream_chat('hello')
+    assert next(stream) == CHUNKS[0]
+    stream.close()
+    for _ in range(50):
+        if get_scheduler().stats()['in_flight'] == 0:
+            break
+        time.sleep(0.02)
+    server.shutdown()
+    assert get_scheduler().stats()['in_flight'] == 0
+
+if __name__ == "__main__":
+    test_stream_chat()
+    test_partial_output_written_early()
+    test_astream_chat_and_early_stop()
+    print("\n✅ 所有测试通过！流式输出工作正常。")
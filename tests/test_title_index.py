@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试标题哈希索引(src/title_index.py)：标题归一化、精确命中，以及空键不参与匹配
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.title_index import TitleHashIndex, normalize_title, TITLE_INDEX_FILE
+
+class ListMetadata():
+    def __init__(self, records):
+        self.records = records
+
+    def iter_records(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+RECORDS = [
+    {'id': 'p0', 'title': 'Semi-Supervised  Learning for Café Reviews.'},
+    {'id': 'p1', 'title': '大语言模型综述'},
+    {'id': 'p2', 'title': '???'},
+    {'id': 'p3', 'title': 'Attention Is All You Need'},
+]
+
+def test_normalize_title():
+    """大小写、重音、标点和空白不影响归一化后的标题"""
+    assert normalize_title('Semi-Supervised  Learning for Café Reviews.') == normalize_title('semisupervised learning for cafe reviews')
+    assert normalize_title('???') == ''
+
+def test_lookup():
+    """引用的标题精确命中论文id；空的或无法归一化的引用不命中，交给向量检索"""
+    with tempfile.TemporaryDirectory() as db_path:
+        index = TitleHashIndex(db_path, ListMetadata(RECORDS))
+        assert index.lookup('attention is all you need') == 'p3'
+        assert index.lookup('Semi-supervised learning for cafe reviews') == 'p0'
+        assert index.lookup('Unknown paper') is None
+        assert index.lookup('') is None
+        assert index.lookup('——') is None
+        assert '' not in index.load()
+        assert os.path.exists(os.path.join(db_path, TITLE_INDEX_FILE))
+
+def test_rebuild_when_store_grows():
+    """元数据中的论文数量变化时重建保存的索引"""
+    with tempfile.TemporaryDirectory() as db_path:
+        TitleHashIndex(db_path, ListMetadata(RECORDS[:2])).load()
+        index = TitleHashIndex(db_path, ListMetadata(RECORDS))
+        assert index.lookup('Attention is all you need!') == 'p3'
+
+if __name__ == "__main__":
+    test_normalize_title()
+    test_lookup()
+    test_rebuild_when_store_grows()
+    print("\n✅ 所有测试通过！标题哈希索引工作正常。")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+测试写作阶段的批量检索(src/agents/writer.py的retrieve_references)：所有小节描述用一次get_ids_from_queries检索，
+结果与逐个调用get_ids_from_query相同。需要src/embedding.py和writer的依赖(torch、transformers、langchain)；
+编码模型由按文本生成固定向量的编码器代替
+"""
+
+import os
+import sys
+import json
+import zlib
+import tempfile
+import numpy as np
+import faiss
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database import database
+from src.agents.writer import subsectionWriter
+from src.ann_index import FIELDS, flat_index_path
+from src.id_map import ID_MAP_FILE
+from src.metadata_store import TINYDB_FILE, TABLE_NAME
+
+DIM = 16
+TOPICS = ['language models', 'image classification', 'graph networks', 'speech recognition', 'reinforcement learning']
+
+class HashEncoder():
+    '''
+    Deterministic unit vectors: each word adds a fixed random direction, so texts sharing words are close.
+    '''
+
+    def encode(self, texts, batch_size=32):
+        vectors = np.zeros((len(texts), DIM), dtype='float32')
+        for i, text in enumerate(texts):
+            for word in text.lower().replace(':', ' ').split():
+                vectors[i] += np.random.default_rng(zlib.crc32(word.encode('utf-8'))).standard_normal(DIM)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+OUTLINE = '''# A survey
+## 1 Foundations
+Description: Background.
+### 1.1 Language models
+Description: Pretrained language models and their scaling.
+### 1.2 Vision
+Description: Convolutional networks for image classification.
+## 2 Applications
+Description: Where the methods are used.
+### 2.1 Graphs
+Description: Graph networks for molecules.
+### 2.2 Agents
+Description: Reinforcement learning agents built on language models.
+### 2.3 Speech
+Description: Speech recognition with self-supervised pretraining.
+'''
+
+def make_database(db_path, n=60):
+    papers = [{'id': f'2401.{i:05d}', 'title': f'Paper {i} on {TOPICS[i % len(TOPICS)]}',
+               'abs': f'We study {TOPICS[i % len(TOPICS)]} with method {i}.', 'date': '2024-01-01'} for i in range(n)]
+    with open(os.path.join(db_path, TINYDB_FILE), 'w') as f:
+        json.dump({TABLE_NAME: {str(i + 1): p for i, p in enumerate(papers)}}, f)
+    with open(os.path.join(db_path, ID_MAP_FILE), 'w') as f:
+        json.dump({p['id']: i for i, p in enumerate(papers)}, f)
+    for field in FIELDS:
+        index = faiss.IndexFlatIP(DIM)
+        index.add(HashEncoder().encode(['search_document: ' + p[field] for p in papers]))
+        faiss.write_index(index, flat_index_path(db_path, field))
+    db = database(db_path, 'hash-encoder', embedding_batch_window=0)
+    db._embedding_model = HashEncoder()
+    return db
+
+class CountingDatabase():
+    def __init__(self, db) -> None:
+        self.db = db
+        self.calls = []
+
+    def get_ids_from_queries(self, queries, num, shuffle = False, filters = None):
+        self.calls.append(list(queries))
+        return self.db.get_ids_from_queries(queries, num, shuffle, filters)
+
+def test_batched_retrieval_matches_per_query_loop():
+    """一次批量检索的结果与逐个小节检索的结果相同，并且只调用一次get_ids_from_queries"""
+    with tempfile.TemporaryDirectory() as db_path:
+        db = make_database(db_path)
+        counting = CountingDatabase(db)
+        writer = subsectionWriter('stub-model', 'no-key', 'http://127.0.0.1:9/v1/chat/completions', database=counting)
+        parsed_outline = writer.parse_outline(OUTLINE)
+        batched = writer.retrieve_references(parsed_outline, rag_num=8)
+        assert len(counting.calls) == 1 and len(counting.calls[0]) == 5
+
+        looped = [[db.get_ids_from_query(d, num=8, shuffle=False) for d in descriptions] for descriptions in parsed_outline['subsection_descriptions']]
+        assert batched == looped
+        assert [len(_) for _ in batched] == [2, 3]
+        assert all(len(ids) == 8 for references in batched for ids in references)
+
+if __name__ == "__main__":
+    test_batched_retrieval_matches_per_query_loop()
+    print("\n✅ 所有测试通过！批量检索与逐个检索的结果一致。")